@@ -3,6 +3,8 @@ from flask import Flask, render_template, request, redirect, url_for, session, j
 import os
 import sys
 import datetime
+import importlib
+import importlib.util
 from fhirclient import client
 import fhir_data_service
 from dotenv import load_dotenv
@@ -20,13 +22,59 @@ from audit_logger import get_audit_logger, audit_ephi_access, log_user_authentic
 from ccd_generator import generate_ccd_from_session_data
 
 # --- Google Secret Manager Helper ---
-# Import the Secret Manager client library.
+# The Secret Manager client pulls in grpc and protobuf, which is slow and memory
+# heavy, so only check that it is installed here and import it on first use.
 try:
-    from google.cloud import secretmanager
-    HAS_SECRET_MANAGER = True
-except ImportError:
+    HAS_SECRET_MANAGER = importlib.util.find_spec('google.cloud.secretmanager') is not None
+except ModuleNotFoundError:
     HAS_SECRET_MANAGER = False
 
+_secretmanager = None
+
+def _get_secretmanager():
+    """Imports google.cloud.secretmanager the first time a secret is resolved."""
+    global _secretmanager
+    if _secretmanager is None:
+        _secretmanager = importlib.import_module('google.cloud.secretmanager')
+    return _secretmanager
+
+# Redis-backed sessions are optional; the filesystem backend is the default.
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+# orjson serializes responses several times faster than the stdlib json module.
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+if HAS_ORJSON:
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """
+        Flask JSON provider backed by orjson, used by jsonify() and request.get_json().
+        Dates, dataclasses and other non-native types are passed through to Flask's
+        default handler so the output matches the stdlib provider.
+        """
+        _BASE_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME |
+                         orjson.OPT_PASSTHROUGH_DATACLASS)
+
+        def dumps(self, obj, **kwargs):
+            option = self._BASE_OPTIONS
+            if kwargs.get('sort_keys', self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
 def get_secret(env_var, default=None):
     """
     Retrieves a secret from environment variables or Google Secret Manager.
@@ -49,7 +97,7 @@ def get_secret(env_var, default=None):
                     return default
                 resolved_value = resolved_value.replace('${PROJECT_ID}', gcp_project)
 
-            client = secretmanager.SecretManagerServiceClient()
+            client = _get_secretmanager().SecretManagerServiceClient()
             response = client.access_secret_version(name=resolved_value)
             return response.payload.data.decode('UTF-8')
         except Exception as e:
@@ -79,6 +127,8 @@ except UnicodeDecodeError as e:
     raise
 
 app = Flask(__name__)
+if HAS_ORJSON:
+    app.json = OrjsonProvider(app)
 
 # R-01 Risk Mitigation: Ensure FLASK_SECRET_KEY is set from environment
 SECRET_KEY = get_secret('FLASK_SECRET_KEY')
@@ -91,6 +141,15 @@ app.secret_key = SECRET_KEY
 # Configure Flask-Session for server-side session storage
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = False
+# A shared Redis store (SESSION_REDIS_URL) lets every worker and instance see the
+# same sessions without file locking on a local directory
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL')
+if SESSION_REDIS_URL and HAS_REDIS:
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.from_url(SESSION_REDIS_URL)
+    app.config['SESSION_USE_SIGNER'] = True
+elif SESSION_REDIS_URL:
+    app.logger.warning("SESSION_REDIS_URL is set but the redis package is not installed; using filesystem sessions.")
 # Determine session directory based on environment
 if os.environ.get('GAE_ENV', '').startswith('standard'):
     # Use secure temp directory for Google App Engine
@@ -201,7 +260,7 @@ def calculate_risk_api():
                 'details': 'The specified patient may not exist or you may not have access to their data'
             }), 404
 
-        demographics = fhir_data_service.get_patient_demographics(raw_data.get('patient'))
+        demographics = fhir_data_service.get_patient_demographics(raw_data['patient'])
         score_components, total_score = fhir_data_service.calculate_precise_hbr_score(raw_data, demographics)
         display_info = fhir_data_service.get_precise_hbr_display_info(total_score)
         final_response = {
@@ -310,6 +369,9 @@ def export_ccd_api():
         app.logger.error(f"Error generating CCD: {str(e)}", exc_info=True)
         return jsonify({'error': 'Failed to generate CCD document.', 'details': str(e)}), 500
 
+# Token response fields that must never reach the logs
+TOKEN_RESPONSE_SECRET_KEYS = frozenset({'access_token', 'refresh_token', 'id_token'})
+
 @app.route('/api/exchange-code', methods=['POST'])
 def exchange_code():
     """API to exchange authorization code for an access token."""
@@ -340,10 +402,13 @@ def exchange_code():
             auth_b64 = base64.b64encode(auth_str.encode('utf-8')).decode('utf-8')
             headers['Authorization'] = f"Basic {auth_b64}"
             token_params.pop('client_id', None)
-        response = requests.post(token_url, data=token_params, headers=headers, timeout=15)
+        response = smart_auth.http_session.post(token_url, data=token_params, headers=headers, timeout=15)
         response.raise_for_status()
-        token_response = response.json()
-        app.logger.info(f"Received token response: {token_response}")
+        token_response = smart_auth.response_json(response)
+        if app.logger.isEnabledFor(logging.INFO):
+            app.logger.info("Received token response: %s", {
+                key: '[REDACTED]' if key in TOKEN_RESPONSE_SECRET_KEYS else value
+                for key, value in token_response.items()})
         # --- DEBUG: Log the exact scopes granted by the EHR ---
         granted_scopes = token_response.get('scope', 'No scopes returned from EHR')
         app.logger.critical(f"Granted scopes from EHR: {granted_scopes}")
@@ -527,6 +592,9 @@ def logout():
         user_agent=request.headers.get('User-Agent')
     )
     
+    fhir_session_data = session.get('fhir_data') or {}
+    if fhir_session_data.get('token'):
+        fhir_data_service.evict_fhir_data_for_token(fhir_session_data['token'])
     session.clear()
     
     # If it's a POST request (from JavaScript), return JSON
@@ -536,15 +604,16 @@ def logout():
     # If it's a GET request (direct navigation), redirect to index
     return redirect(url_for('index'))
 
-@app.after_request
-def add_security_headers(response: Response):
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    return response
+# Static headers added to every response (HSTS and no-caching of ePHI pages)
+STATIC_RESPONSE_HEADERS = {
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    'Pragma': 'no-cache',
+}
 
 @app.after_request
-def add_cache_control_headers(response):
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
+def add_security_headers(response: Response):
+    response.headers.update(STATIC_RESPONSE_HEADERS)
     return response
 
 # --- Main Execution ---
@@ -573,7 +642,10 @@ csp = {
         'cdnjs.cloudflare.com'
     ]
 }
-Talisman(app, content_security_policy=csp)
+# FORCE_HTTPS=false skips Talisman's per-request HTTP->HTTPS redirect check, for local
+# development or when the load balancer in front of the app already redirects.
+FORCE_HTTPS = os.environ.get('FORCE_HTTPS', 'true').lower() not in ['false', '0', 'f']
+Talisman(app, content_security_policy=csp, force_https=FORCE_HTTPS)
 
 # Initialize CSRF protection
 csrf = CSRFProtect()
@@ -612,6 +684,12 @@ app.register_blueprint(hooks_bp)  # CDS Hooks
 csrf.exempt(smart_auth.auth_bp)
 csrf.exempt(views.views_bp)
 
+# Compile all page templates at startup so the first request to each page in a
+# worker doesn't pay the Jinja parse/compile cost. Outside debug mode Flask
+# doesn't re-check template files, so the compiled versions are reused as-is.
+for template_name in app.jinja_env.list_templates(extensions=['html']):
+    app.jinja_env.get_template(template_name)
+
 if __name__ == '__main__':
     # R-08 Risk Mitigation: Enhanced production environment checks
     is_production = (
@@ -2,15 +2,34 @@ import logging
 import datetime as dt
 import json
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
 from dateutil.parser import parse as parse_date
 from dateutil.relativedelta import relativedelta
 from fhirclient import client
 from fhirclient.models import patient, observation, condition, medicationrequest, procedure
 
+# orjson parses bytes directly and is several times faster than the json module
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+def _json_loads(data):
+    """Parses a JSON document (bytes or str) with orjson when available."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
 # --- Load CDSS Config ---
 try:
-    with open('cdss_config.json', 'r', encoding='utf-8') as f:
-        CDSS_CONFIG = json.load(f)
+    with open('cdss_config.json', 'rb') as f:
+        CDSS_CONFIG = _json_loads(f.read())
     logging.info("Successfully loaded cdss_config.json")
 except FileNotFoundError:
     logging.error("CRITICAL: cdss_config.json not found. Calculations will fail.")
@@ -41,7 +60,7 @@ def _get_loinc_codes():
 def _get_text_search_terms():
     """
     Load text search terms from cdss_config.json.
-    Returns dictionary mapping observation types to list of text search terms.
+    Returns dictionary mapping observation types to tuples of text search terms.
     """
     if not CDSS_CONFIG:
         return {}
@@ -49,16 +68,18 @@ def _get_text_search_terms():
     lab_config = CDSS_CONFIG.get('laboratory_value_extraction', {})
     
     return {
-        "EGFR": lab_config.get('egfr_text_search', []),
-        "CREATININE": lab_config.get('creatinine_text_search', []),
-        "HEMOGLOBIN": lab_config.get('hemoglobin_text_search', []),
-        "WBC": lab_config.get('wbc_text_search', []),
-        "PLATELETS": lab_config.get('platelet_text_search', []),
+        "EGFR": tuple(lab_config.get('egfr_text_search', [])),
+        "CREATININE": tuple(lab_config.get('creatinine_text_search', [])),
+        "HEMOGLOBIN": tuple(lab_config.get('hemoglobin_text_search', [])),
+        "WBC": tuple(lab_config.get('wbc_text_search', [])),
+        "PLATELETS": tuple(lab_config.get('platelet_text_search', [])),
     }
 
 # Initialize LOINC_CODES and TEXT_SEARCH_TERMS from configuration
 LOINC_CODES = _get_loinc_codes()
 TEXT_SEARCH_TERMS = _get_text_search_terms()
+# Comma-joined LOINC codes per lab group, ready for the Observation search 'code' parameter
+LOINC_CODE_SEARCH_PARAMS = {resource_type: ','.join(codes) for resource_type, codes in LOINC_CODES.items()}
 
 # --- Unit Conversion System ---
 
@@ -121,13 +142,260 @@ TARGET_UNITS = {
     }
 }
 
+# Unit notation variations: caret (^) to asterisk (*), micro signs (µ, μ) to 'u', no spaces
+_UNIT_NOTATION_TABLE = str.maketrans({'^': '*', 'µ': 'u', 'μ': 'u', ' ': None})
+
+def _normalize_unit(unit):
+    """Lowercases a unit string and normalizes its notation for factor lookups."""
+    return unit.strip().lower().translate(_UNIT_NOTATION_TABLE)
+
+# Normalize the factor keys once here rather than on every conversion
+for _unit_system in TARGET_UNITS.values():
+    _unit_system['normalized_factors'] = {
+        _normalize_unit(unit): factor for unit, factor in _unit_system['factors'].items()}
+
+def _latest_observation(observations):
+    """Returns the most recent of the given Observation JSON dicts by effective date, or None."""
+    return max(
+        observations,
+        key=lambda obs: obs.get('effectiveDateTime') or obs.get('effectivePeriod', {}).get('start') or '1900-01-01',
+        default=None)
+
+def _fetch_latest_observations(server, patient_id, resource_type, codes):
+    """
+    Fetches the most recent Observation for one lab group (by LOINC codes, with a
+    text search fallback). `codes` is the comma-joined LOINC code list (see
+    LOINC_CODE_SEARCH_PARAMS). Returns a list with at most one Observation resource.
+    """
+    obs_list = []
+    
+    try:
+        # First, try searching by LOINC codes
+        if codes:
+            search_params = {
+                'patient': patient_id,
+                'code': codes,
+                '_count': '5'  # Get a few results to find the most recent
+            }
+            
+            observations = observation.Observation.where(search_params).perform(server)
+            
+            if observations.entry:
+                # Pick by effective date in memory (more compatible than _sort parameter)
+                latest = _latest_observation(
+                    entry.resource.as_json() for entry in observations.entry if entry.resource)
+                if latest:
+                    obs_list.append(latest)
+                    logging.info(f"Successfully fetched {resource_type} observation by LOINC code")
+        
+        # If no results from LOINC codes, try text search as fallback
+        if not obs_list and resource_type in TEXT_SEARCH_TERMS:
+            text_terms = TEXT_SEARCH_TERMS[resource_type]
+            if text_terms:
+                logging.info(f"No results from LOINC codes for {resource_type}, attempting text search with terms: {text_terms}")
+                
+                # Try each text search term
+                for term in text_terms:
+                    try:
+                        text_search_params = {
+                            'patient': patient_id,
+                            'code:text': term,
+                            '_count': '5'
+                        }
+                        
+                        text_observations = observation.Observation.where(text_search_params).perform(server)
+                        
+                        if text_observations.entry:
+                            latest = _latest_observation(
+                                entry.resource.as_json() for entry in text_observations.entry if entry.resource)
+                            if latest:
+                                obs_list.append(latest)
+                                logging.info(f"Successfully fetched {resource_type} observation by text search: '{term}'")
+                                break  # Found a result, stop searching
+                    except Exception as text_error:
+                        logging.debug(f"Text search failed for term '{term}': {type(text_error).__name__}")
+                        continue
+        
+        if obs_list:
+            logging.info(f"Final result: {len(obs_list)} {resource_type} observation(s)")
+        else:
+            logging.warning(f"No {resource_type} observations found for patient {patient_id}")
+        return obs_list
+        
+    except Exception as e:
+        # Sanitize logging
+        logging.warning(f"Error fetching {resource_type} for patient {patient_id}. Type: {type(e).__name__}. Continuing with empty list.")
+        return []
+
+# The condition checks only read these Condition elements, so the server can leave
+# out notes, evidence, stages etc. (servers without _elements support return everything).
+# subject is mandatory and fhirclient rejects resources without it.
+CONDITION_ELEMENTS = 'code,clinicalStatus,subject'
+
+def _fetch_conditions(server, patient_id):
+    """
+    Fetches the patient's conditions (for bleeding history).
+    Server errors are logged and yield an empty list.
+    """
+    try:
+        # Fetch 100 conditions with extended timeout
+        conditions_list = []
+        
+        logging.info(f"Attempting to fetch conditions with _count=100 for patient {patient_id} (90s timeout)")
+        conditions_search = condition.Condition.where({
+            'patient': patient_id,
+            '_count': '100',  # Fetch 100 conditions with extended timeout
+            '_elements': CONDITION_ELEMENTS
+        }).perform(server)
+        
+        if conditions_search.entry:
+            for entry in conditions_search.entry:  # Process all returned conditions
+                if entry.resource:
+                    conditions_list.append(entry.resource.as_json())
+        
+        logging.info(f"Successfully fetched {len(conditions_list)} condition(s) with _count=100")
+        return conditions_list
+        
+    except Exception as e:
+        error_str = str(e)
+        if '504' in error_str or 'timeout' in error_str.lower() or 'gateway time-out' in error_str.lower():
+            # Sanitize logging
+            logging.error(f"Timeout error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
+            logging.info("This suggests the FHIR server is very slow or overloaded")
+        elif '401' in error_str or '403' in error_str:
+            logging.error(f"Permission error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
+        else:
+            logging.error(f"Unexpected error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
+        
+        # Continue with empty conditions list
+        logging.warning(f"Continuing with empty conditions list for patient {patient_id} due to a server error.")
+        return []
+
+def _fetch_labs_and_conditions(server, patient_id, lab_codes):
+    """
+    Fetches the latest Observation of each lab group in lab_codes (resource type ->
+    comma-joined LOINC codes) and the patient's conditions. All searches go out as
+    one batch request where the server supports it; lab groups without LOINC results
+    still get the text search fallback. Returns a dict shaped like raw_data.
+    """
+    coded_labs = [resource_type for resource_type, codes in lab_codes.items() if codes]
+    searches = [f"Observation?{urlencode({'patient': patient_id, 'code': lab_codes[resource_type], '_count': '5'})}"
+                for resource_type in coded_labs]
+    searches.append(f"Condition?{urlencode({'patient': patient_id, '_count': '100', '_elements': CONDITION_ELEMENTS})}")
+    bundles = _perform_batch_search(server, searches)
+    
+    # resource type -> codes for the lab groups still to be searched individually;
+    # codes=None skips straight to the text search fallback
+    pending_labs = dict(lab_codes)
+    results = {}
+    fetch_conditions = True
+    if bundles is not None:
+        *lab_bundles, conditions_bundle = bundles
+        for resource_type, bundle in zip(coded_labs, lab_bundles):
+            if bundle is None:
+                continue
+            latest = _latest_observation(
+                entry['resource'] for entry in bundle.get('entry') or [] if entry.get('resource'))
+            if latest:
+                results[resource_type] = [latest]
+                del pending_labs[resource_type]
+            else:
+                pending_labs[resource_type] = None
+        if conditions_bundle is not None:
+            results['conditions'] = [
+                entry['resource'] for entry in conditions_bundle.get('entry') or [] if entry.get('resource')]
+            fetch_conditions = False
+    
+    if not pending_labs and not fetch_conditions:
+        return results
+    
+    # The remaining searches are independent, so issue them concurrently and let
+    # their round trips overlap instead of paying them one by one
+    with ThreadPoolExecutor(max_workers=len(pending_labs) + 1) as executor:
+        conditions_future = executor.submit(_fetch_conditions, server, patient_id) if fetch_conditions else None
+        lab_futures = {
+            resource_type: executor.submit(
+                _fetch_latest_observations, server, patient_id, resource_type, codes)
+            for resource_type, codes in pending_labs.items()
+        }
+        for resource_type, future in lab_futures.items():
+            results[resource_type] = future.result()
+        if conditions_future is not None:
+            results['conditions'] = conditions_future.result()
+    return results
+
+# --- Shared HTTP connection pool for FHIR requests ---
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request it sends."""
+    def __init__(self, *args, **kwargs):
+        self.timeout = kwargs.pop('timeout', 60)  # 60 seconds default
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        kwargs['timeout'] = kwargs.get('timeout') or self.timeout
+        return super().send(request, **kwargs)
+
+# fhirclient creates a new requests.Session per client. Mounting one adapter on
+# every session shares its connection pool, so keep-alive connections (and their
+# TLS handshakes) are reused across patient fetches instead of rebuilt each time.
+# The pool is sized for the concurrent lab searches.
+_FHIR_HTTP_ADAPTER = TimeoutHTTPAdapter(timeout=90, pool_maxsize=20)  # 90 seconds for condition queries
+
+# Static content-negotiation headers for every FHIR session; only the bearer token
+# differs per request, so it is the only part built per call.
+_FHIR_SESSION_HEADERS = {
+    'Accept': 'application/fhir+json, application/json',
+    'Content-Type': 'application/fhir+json'
+}
+
+# --- Short-lived cache of fetched patient data ---
+# The risk page, the tradeoff page and browser refreshes all ask for the same
+# patient within seconds of each other. Entries are keyed by access token, so a
+# new launch never sees data fetched under a previous authorization.
+FHIR_DATA_CACHE_TTL_SECONDS = 60
+_fhir_data_cache = TTLCache(maxsize=256, ttl=FHIR_DATA_CACHE_TTL_SECONDS)
+# Tradeoff model inputs for the same patients, keyed the same way
+_tradeoff_data_cache = TTLCache(maxsize=256, ttl=FHIR_DATA_CACHE_TTL_SECONDS)
+_fhir_data_cache_lock = threading.Lock()
+
+def clear_fhir_data_cache():
+    """Drops all cached patient data."""
+    with _fhir_data_cache_lock:
+        _fhir_data_cache.clear()
+        _tradeoff_data_cache.clear()
+
+def evict_fhir_data_for_token(access_token):
+    """Drops cached patient data fetched under an access token (e.g. on logout)."""
+    with _fhir_data_cache_lock:
+        for cache in (_fhir_data_cache, _tradeoff_data_cache):
+            for cache_key in [key for key in cache if key[2] == access_token]:
+                cache.pop(cache_key, None)
+
 def get_fhir_data(fhir_server_url, access_token, patient_id, client_id):
     """
     Fetches all required patient data using the fhirclient library.
     This provides better compatibility with various FHIR servers including Cerner.
+    Successful results are cached for FHIR_DATA_CACHE_TTL_SECONDS; callers get a
+    shallow copy, so adding or replacing keys does not leak into the cached entry.
     
     Returns a dictionary of FHIR resources and an error message if any.
     """
+    cache_key = (fhir_server_url, patient_id, access_token)
+    with _fhir_data_cache_lock:
+        raw_data = _fhir_data_cache.get(cache_key)
+    if raw_data is not None:
+        logging.info(f"Using cached FHIR data for patient {patient_id}")
+        return dict(raw_data), None
+    
+    raw_data, error = _fetch_fhir_data(fhir_server_url, access_token, patient_id, client_id)
+    if raw_data is not None and error is None:
+        with _fhir_data_cache_lock:
+            _fhir_data_cache[cache_key] = raw_data
+        return dict(raw_data), None
+    return raw_data, error
+
+def _fetch_fhir_data(fhir_server_url, access_token, patient_id, client_id):
+    """Fetches the patient data from the FHIR server (uncached, see get_fhir_data)."""
     try:
         # Detect test mode (for development/testing without OAuth)
         is_test_mode = (access_token == 'test-mode-no-auth')
@@ -159,11 +427,7 @@ def get_fhir_data(fhir_server_url, access_token, patient_id, client_id):
             smart.server.auth = None  # Clear any existing auth
             
             # Set proper headers for FHIR requests
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/fhir+json, application/json',
-                'Content-Type': 'application/fhir+json'
-            }
+            headers = {**_FHIR_SESSION_HEADERS, 'Authorization': f'Bearer {access_token}'}
             
             # Use the server's session to set headers
             if hasattr(smart.server, 'session'):
@@ -183,32 +447,14 @@ def get_fhir_data(fhir_server_url, access_token, patient_id, client_id):
                 smart.server.session = requests.Session()
             
             # Set headers without Authorization
-            headers = {
-                'Accept': 'application/fhir+json, application/json',
-                'Content-Type': 'application/fhir+json'
-            }
-            smart.server.session.headers.update(headers)
+            smart.server.session.headers.update(_FHIR_SESSION_HEADERS)
             logging.info("TEST MODE: Session configured for public FHIR access")
         
         # Set up custom adapter with timeout for the session (for both modes)
         if hasattr(smart.server, 'session'):
-            import requests
-            from requests.adapters import HTTPAdapter
-            
-            # Configure custom adapter with longer timeout
-            class TimeoutHTTPAdapter(HTTPAdapter):
-                def __init__(self, *args, **kwargs):
-                    self.timeout = kwargs.pop('timeout', 60)  # 60 seconds default
-                    super().__init__(*args, **kwargs)
-                
-                def send(self, request, **kwargs):
-                    kwargs['timeout'] = kwargs.get('timeout', self.timeout)
-                    return super().send(request, **kwargs)
-            
-            # Mount the adapter to both HTTP and HTTPS
-            adapter = TimeoutHTTPAdapter(timeout=90)  # 90 seconds for condition queries
-            smart.server.session.mount('http://', adapter)
-            smart.server.session.mount('https://', adapter)
+            # Mount the shared pooled adapter to both HTTP and HTTPS
+            smart.server.session.mount('http://', _FHIR_HTTP_ADAPTER)
+            smart.server.session.mount('https://', _FHIR_HTTP_ADAPTER)
             
             if not is_test_mode:
                 # Also set the _auth for backward compatibility (production mode only)
@@ -263,117 +509,16 @@ def get_fhir_data(fhir_server_url, access_token, patient_id, client_id):
 
         raw_data = {"patient": patient_resource.as_json()}
         
-        # Fetch observations by LOINC codes for PRECISE-HBR parameters
-        for resource_type, codes in LOINC_CODES.items():
-            obs_list = []
-            
-            try:
-                # First, try searching by LOINC codes
-                if codes:
-                    search_params = {
-                        'patient': patient_id,
-                        'code': ','.join(codes),
-                        '_count': '5'  # Get a few results to find the most recent
-                    }
-                    
-                    observations = observation.Observation.where(search_params).perform(smart.server)
-                    
-                    if observations.entry:
-                        # Sort by effective date in memory (more compatible than _sort parameter)
-                        sorted_entries = []
-                        for entry in observations.entry:
-                            if entry.resource:
-                                resource_json = entry.resource.as_json()
-                                # Extract date for sorting
-                                date_str = resource_json.get('effectiveDateTime') or resource_json.get('effectivePeriod', {}).get('start') or '1900-01-01'
-                                sorted_entries.append((date_str, resource_json))
-                        
-                        # Sort by date (most recent first) and take the first one
-                        sorted_entries.sort(key=lambda x: x[0], reverse=True)
-                        if sorted_entries:
-                            obs_list.append(sorted_entries[0][1])  # Take the most recent
-                            logging.info(f"Successfully fetched {resource_type} observation by LOINC code")
-                
-                # If no results from LOINC codes, try text search as fallback
-                if not obs_list and resource_type in TEXT_SEARCH_TERMS:
-                    text_terms = TEXT_SEARCH_TERMS[resource_type]
-                    if text_terms:
-                        logging.info(f"No results from LOINC codes for {resource_type}, attempting text search with terms: {text_terms}")
-                        
-                        # Try each text search term
-                        for term in text_terms:
-                            try:
-                                text_search_params = {
-                                    'patient': patient_id,
-                                    'code:text': term,
-                                    '_count': '5'
-                                }
-                                
-                                text_observations = observation.Observation.where(text_search_params).perform(smart.server)
-                                
-                                if text_observations.entry:
-                                    sorted_entries = []
-                                    for entry in text_observations.entry:
-                                        if entry.resource:
-                                            resource_json = entry.resource.as_json()
-                                            date_str = resource_json.get('effectiveDateTime') or resource_json.get('effectivePeriod', {}).get('start') or '1900-01-01'
-                                            sorted_entries.append((date_str, resource_json))
-                                    
-                                    sorted_entries.sort(key=lambda x: x[0], reverse=True)
-                                    if sorted_entries:
-                                        obs_list.append(sorted_entries[0][1])
-                                        logging.info(f"Successfully fetched {resource_type} observation by text search: '{term}'")
-                                        break  # Found a result, stop searching
-                            except Exception as text_error:
-                                logging.debug(f"Text search failed for term '{term}': {type(text_error).__name__}")
-                                continue
-                
-                raw_data[resource_type] = obs_list
-                if obs_list:
-                    logging.info(f"Final result: {len(obs_list)} {resource_type} observation(s)")
-                else:
-                    logging.warning(f"No {resource_type} observations found for patient {patient_id}")
-                
-            except Exception as e:
-                # Sanitize logging
-                logging.warning(f"Error fetching {resource_type} for patient {patient_id}. Type: {type(e).__name__}. Continuing with empty list.")
-                raw_data[resource_type] = []
+        # Creatinine is only used to calculate eGFR, which needs both age and sex
+        lab_codes = LOINC_CODE_SEARCH_PARAMS
+        if not (raw_data['patient'].get('birthDate') and raw_data['patient'].get('gender')):
+            logging.info(f"Skipping creatinine fetch for patient {patient_id}: birth date or gender not available")
+            lab_codes = {rt: codes for rt, codes in LOINC_CODE_SEARCH_PARAMS.items() if rt != 'CREATININE'}
+            raw_data['CREATININE'] = []
         
-        # Fetch conditions (for bleeding history)
-        try:
-            # Fetch 100 conditions with extended timeout
-            conditions_list = []
-            
-            logging.info(f"Attempting to fetch conditions with _count=100 for patient {patient_id} (90s timeout)")
-            conditions_search = condition.Condition.where({
-                'patient': patient_id,
-                '_count': '100'  # Fetch 100 conditions with extended timeout
-            }).perform(smart.server)
-            
-            if conditions_search.entry:
-                for entry in conditions_search.entry:  # Process all returned conditions
-                    if entry.resource:
-                        conditions_list.append(entry.resource.as_json())
-            
-            logging.info(f"Successfully fetched {len(conditions_list)} condition(s) with _count=100")
-            
-            raw_data['conditions'] = conditions_list
-            logging.info(f"Final result: {len(conditions_list)} condition(s) stored")
-            
-        except Exception as e:
-            error_str = str(e)
-            if '504' in error_str or 'timeout' in error_str.lower() or 'gateway time-out' in error_str.lower():
-                # Sanitize logging
-                logging.error(f"Timeout error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
-                logging.info("This suggests the FHIR server is very slow or overloaded")
-            elif '401' in error_str or '403' in error_str:
-                logging.error(f"Permission error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
-            else:
-                logging.error(f"Unexpected error fetching conditions for patient {patient_id}. Error type: {type(e).__name__}")
-            
-            # Continue with empty conditions list
-            raw_data['conditions'] = []
-            logging.warning(f"Continuing with empty conditions list for patient {patient_id} due to a server error.")
+        # Fetch observations by LOINC codes for PRECISE-HBR parameters, and the
+        # conditions (for bleeding history)
+        raw_data.update(_fetch_labs_and_conditions(smart.server, patient_id, lab_codes))
         
         # Fetch minimal medication data for compatibility
         raw_data['med_requests'] = []
@@ -383,14 +528,170 @@ def get_fhir_data(fhir_server_url, access_token, patient_id, client_id):
 
     except Exception as e:
         # Sanitize logging for the top-level exception
-        logging.error(f"An unexpected error occurred in get_fhir_data. Error type: {type(e).__name__}", exc_info=False)
+        logging.error(f"An unexpected error occurred in _fetch_fhir_data. Error type: {type(e).__name__}", exc_info=False)
         return None, "An unexpected error occurred while fetching FHIR data."
 
+# Inverted indexes from configured SNOMED code to the tradeoff flag it sets, so each
+# coding of a resource costs one dict lookup instead of one scan per tracked code.
+_TRADEOFF_SNOMED_CODES = CDSS_CONFIG.get('tradeoff_analysis', {}).get('snomed_codes', {})
+_TRADEOFF_CONDITION_FLAGS = {
+    _TRADEOFF_SNOMED_CODES.get('diabetes', '73211009'): 'diabetes',
+    _TRADEOFF_SNOMED_CODES.get('myocardial_infarction', '22298006'): 'prior_mi',
+    _TRADEOFF_SNOMED_CODES.get('nstemi', '164868009'): 'nstemi_stemi',
+    _TRADEOFF_SNOMED_CODES.get('stemi', '164869001'): 'nstemi_stemi',
+    _TRADEOFF_SNOMED_CODES.get('copd', '13645005'): 'copd',
+}
+# SNOMED and LOINC answer codes for "current smoker"
+_CURRENT_SMOKER_CODES = frozenset({'449868002', 'LA18978-9'})
+_TRADEOFF_PROCEDURE_FLAGS = {
+    _TRADEOFF_SNOMED_CODES.get('complex_pci', '397682003'): 'complex_pci',
+    _TRADEOFF_SNOMED_CODES.get('bare_metal_stent', '427183000'): 'bms_used',
+}
+
+# RxNorm codes of the oral anticoagulants that set the "OAC at discharge" flag
+_RXNORM_SYSTEM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+_TRADEOFF_RXNORM_CODES = CDSS_CONFIG.get('tradeoff_analysis', {}).get('rxnorm_codes', {})
+_TRADEOFF_OAC_RXNORM_CODES = frozenset({
+    _TRADEOFF_RXNORM_CODES.get('warfarin', '11289'),
+    _TRADEOFF_RXNORM_CODES.get('rivaroxaban', '21821'),
+    _TRADEOFF_RXNORM_CODES.get('apixaban', '1364430'),
+    _TRADEOFF_RXNORM_CODES.get('dabigatran', '1037042'),
+    _TRADEOFF_RXNORM_CODES.get('edoxaban', '1537033'),
+})
+
+def _snomed_code_param(codes):
+    """Token search value matching any of the given SNOMED codes."""
+    return ','.join(f"http://snomed.info/sct|{code}" for code in codes)
+
+# Searches needed by the tradeoff model: (result key, resource model, search params).
+# Conditions and procedures are only inspected for the flagged SNOMED codes, so the
+# server filters on them instead of returning the patient's whole history.
+_TRADEOFF_SEARCHES = (
+    ('conditions', condition.Condition, {'code': _snomed_code_param(_TRADEOFF_CONDITION_FLAGS), '_count': '200',
+                                         '_elements': 'code,subject'}),
+    ('smoking', observation.Observation, {'code': '72166-2'}),  # Smoking status LOINC
+    ('procedures', procedure.Procedure, {'code': _snomed_code_param(_TRADEOFF_PROCEDURE_FLAGS), '_count': '50',
+                                         '_elements': 'code,status,subject'}),
+    ('med_requests', medicationrequest.MedicationRequest, {'category': 'outpatient'}),
+)
+
+def _perform_batch_search(server, search_urls):
+    """
+    Sends several search URLs to the server as a single FHIR batch Bundle.
+    Returns a list with the searchset Bundle (or None for a failed entry) for each
+    URL, in order, or None if the server did not process the batch.
+    """
+    batch_bundle = {
+        'resourceType': 'Bundle',
+        'type': 'batch',
+        'entry': [{'request': {'method': 'GET', 'url': url}} for url in search_urls]
+    }
+    try:
+        response_bundle = _json_loads(server.post_json('', batch_bundle).content)
+    except Exception as e:
+        logging.info(f"Batch search not available ({type(e).__name__}), using individual searches")
+        return None
+    
+    entries = response_bundle.get('entry') or []
+    if response_bundle.get('type') != 'batch-response' or len(entries) != len(search_urls):
+        logging.info("Unexpected batch response, using individual searches")
+        return None
+    
+    results = []
+    for entry in entries:
+        status = (entry.get('response') or {}).get('status', '')
+        resource = entry.get('resource')
+        results.append(resource if status.startswith('2') and resource else None)
+    return results
+
+def _fetch_tradeoff_resources(server, patient_id):
+    """
+    Fetches the resources used by the tradeoff model, preferring one batch request
+    over one round trip per search. Returns a dict mapping each search key to a list
+    of resource JSON dicts, or None where that search failed.
+    """
+    searches = [(key, model, {'patient': patient_id, **params})
+                for key, model, params in _TRADEOFF_SEARCHES]
+    
+    bundles = _perform_batch_search(
+        server, [f"{model.resource_type}?{urlencode(params)}" for _, model, params in searches])
+    if bundles is not None:
+        resources = {}
+        for (key, _, _), bundle in zip(searches, bundles):
+            if bundle is None:
+                logging.warning(f"Batch entry for {key} failed in tradeoff model search")
+                resources[key] = None
+            else:
+                resources[key] = [entry['resource'] for entry in bundle.get('entry') or [] if entry.get('resource')]
+        return resources
+    
+    # Batch not supported: run the individual searches concurrently so the
+    # round trips overlap instead of adding up
+    with ThreadPoolExecutor(max_workers=len(searches)) as executor:
+        futures = {key: executor.submit(_perform_tradeoff_search, server, key, model, params)
+                   for key, model, params in searches}
+        return {key: future.result() for key, future in futures.items()}
+
+def _perform_tradeoff_search(server, key, model, params):
+    """Runs one tradeoff model search, returning resource JSON dicts or None on failure."""
+    try:
+        # Note: fhirclient's perform() doesn't accept timeout parameter
+        # Timeout is configured via the HTTPAdapter on the session
+        bundle = model.where(params).perform(server)
+        return [entry.resource.as_json() for entry in bundle.entry or [] if entry.resource]
+    except Exception as e:
+        logging.warning(f"Error fetching {key} for tradeoff model: {e}")
+        return None
+
+def _flag_coded_resources(resources, code_flags, tradeoff_data):
+    """Sets the tradeoff flag for every SNOMED code in code_flags found on the resources."""
+    remaining_flags = set(code_flags.values())
+    for resource in resources:
+        for coding in resource.get('code', {}).get('coding', []):
+            if coding.get('system') == 'http://snomed.info/sct':
+                flag = code_flags.get(coding.get('code'))
+                if flag:
+                    tradeoff_data[flag] = True
+                    remaining_flags.discard(flag)
+        if not remaining_flags:
+            # Every flag this table can set is already set
+            return
+
+_TRADEOFF_DATA_DEFAULTS = {
+    "diabetes": False, "prior_mi": False, "smoker": False,
+    "nstemi_stemi": False, "complex_pci": False, "bms_used": False,
+    "copd": False, "oac_discharge": False
+}
+
 def get_tradeoff_model_data(fhir_server_url, access_token, client_id, patient_id):
     """
     Fetches additional data required for the Bleeding-Thrombosis tradeoff model.
     This complements the data fetched by get_fhir_data.
-    Now creates its own client for robustness.
+    Results are cached for FHIR_DATA_CACHE_TTL_SECONDS, except when the FHIR
+    client could not be created or any of the searches failed.
+    """
+    cache_key = (fhir_server_url, patient_id, access_token)
+    with _fhir_data_cache_lock:
+        tradeoff_data = _tradeoff_data_cache.get(cache_key)
+    if tradeoff_data is not None:
+        logging.info(f"Using cached tradeoff data for patient {patient_id}")
+        return dict(tradeoff_data)
+
+    tradeoff_data, complete = _fetch_tradeoff_model_data(fhir_server_url, access_token, client_id, patient_id)
+    if tradeoff_data is None:
+        # Return empty data structure on client creation failure
+        return dict(_TRADEOFF_DATA_DEFAULTS)
+    if complete:
+        # Flags left False by a failed search must not stick for the cache lifetime
+        with _fhir_data_cache_lock:
+            _tradeoff_data_cache[cache_key] = tradeoff_data
+    return dict(tradeoff_data)
+
+def _fetch_tradeoff_model_data(fhir_server_url, access_token, client_id, patient_id):
+    """
+    Fetches the tradeoff model flags with a dedicated FHIR client.
+    Returns (tradeoff_data, complete), where complete is False if any search
+    failed, or (None, False) if the client could not be created.
     """
     try:
         settings = {
@@ -404,145 +705,66 @@ def get_tradeoff_model_data(fhir_server_url, access_token, client_id, patient_id
         if not hasattr(fhir_client.server, 'session'):
             fhir_client.server.session = requests.Session()
         fhir_client.server.session.headers["Authorization"] = f"Bearer {access_token}"
+        # Share the pooled adapter with get_fhir_data, so the tradeoff searches reuse
+        # the keep-alive connections the risk page already opened to this server
+        fhir_client.server.session.mount('http://', _FHIR_HTTP_ADAPTER)
+        fhir_client.server.session.mount('https://', _FHIR_HTTP_ADAPTER)
 
     except Exception as e:
         logging.error(f"Failed to create FHIRClient in get_tradeoff_model_data: {e}")
-        # Return empty data structure on client creation failure
-        return {
-            "diabetes": False, "prior_mi": False, "smoker": False,
-            "nstemi_stemi": False, "complex_pci": False, "bms_used": False,
-            "copd": False, "oac_discharge": False
-        }
+        return None, False
 
-    tradeoff_data = {
-        "diabetes": False,
-        "prior_mi": False,
-        "smoker": False,
-        "nstemi_stemi": False,
-        "complex_pci": False,
-        "bms_used": False,
-        "copd": False,
-        "oac_discharge": False
-    }
+    tradeoff_data = dict(_TRADEOFF_DATA_DEFAULTS)
 
-    # Use a broader condition search to find relevant diagnoses
-    try:
-        search_params = {'patient': patient_id, '_count': '200'}
-        # Note: fhirclient's perform() doesn't accept timeout parameter
-        # Timeout is configured via the HTTPAdapter on the session
-        conditions = condition.Condition.where(search_params).perform(fhir_client.server)
-        
-        if conditions.entry:
-            for entry in conditions.entry:
-                c = entry.resource
-                # Get SNOMED codes from configuration
-                snomed_codes = CDSS_CONFIG.get('tradeoff_analysis', {}).get('snomed_codes', {})
-                
-                # Diabetes Mellitus
-                diabetes_code = snomed_codes.get('diabetes', '73211009')
-                if _resource_has_code(c.as_json(), 'http://snomed.info/sct', diabetes_code):
-                    tradeoff_data["diabetes"] = True
-                
-                # Myocardial Infarction
-                mi_code = snomed_codes.get('myocardial_infarction', '22298006')
-                if _resource_has_code(c.as_json(), 'http://snomed.info/sct', mi_code):
-                    tradeoff_data["prior_mi"] = True
-                
-                # NSTEMI/STEMI
-                nstemi_code = snomed_codes.get('nstemi', '164868009')
-                stemi_code = snomed_codes.get('stemi', '164869001')
-                if _resource_has_code(c.as_json(), 'http://snomed.info/sct', nstemi_code) or \
-                   _resource_has_code(c.as_json(), 'http://snomed.info/sct', stemi_code):
-                    tradeoff_data["nstemi_stemi"] = True
-                
-                # COPD
-                copd_code = snomed_codes.get('copd', '13645005')
-                if _resource_has_code(c.as_json(), 'http://snomed.info/sct', copd_code):
-                    tradeoff_data["copd"] = True
+    resources = _fetch_tradeoff_resources(fhir_client.server, patient_id)
 
-    except Exception as e:
-        logging.warning(f"Error fetching conditions for tradeoff model: {e}")
+    # Use a broader condition search to find relevant diagnoses
+    conditions = resources.get('conditions')
+    if conditions:
+        _flag_coded_resources(conditions, _TRADEOFF_CONDITION_FLAGS, tradeoff_data)
 
     # Check for smoking status from Observations
-    try:
-        search_params = {'patient': patient_id, 'code': '72166-2'}  # Smoking status LOINC
-        # Note: fhirclient's perform() doesn't accept timeout parameter
-        # Timeout is configured via the HTTPAdapter on the session
-        obs_search = observation.Observation.where(search_params).perform(fhir_client.server)
-        if obs_search and obs_search.entry:
-            # Safe sorting by date
-            sorted_obs = []
-            for entry in obs_search.entry:
-                if entry.resource:
-                    # Use a safe way to get the date, with a fallback
-                    date_str = '1900-01-01' # fallback
-                    if hasattr(entry.resource, 'effectiveDateTime') and entry.resource.effectiveDateTime:
-                        date_str = entry.resource.effectiveDateTime.isostring
-                    elif hasattr(entry.resource, 'effectivePeriod') and entry.resource.effectivePeriod and entry.resource.effectivePeriod.start:
-                        date_str = entry.resource.effectivePeriod.start.isostring
-                    sorted_obs.append((date_str, entry.resource))
-            
-            if sorted_obs:
-                sorted_obs.sort(key=lambda x: x[0], reverse=True)
-                latest_obs = sorted_obs[0][1] # Get the resource part
-                # Check for Current smoker codes
-                if latest_obs.valueCodeableConcept and latest_obs.valueCodeableConcept.coding:
-                    if latest_obs.valueCodeableConcept.coding[0].code in ['449868002', 'LA18978-9']: 
-                        tradeoff_data["smoker"] = True
-    except Exception as e:
-        logging.warning(f"Error fetching smoking status: {e}", exc_info=True)
+    smoking_obs = resources.get('smoking')
+    if smoking_obs:
+        # Safe sorting by date, with a fallback for undated observations
+        latest_obs = max(
+            smoking_obs,
+            key=lambda obs: obs.get('effectiveDateTime') or obs.get('effectivePeriod', {}).get('start') or '1900-01-01')
+        # Check for Current smoker codes
+        value_codings = latest_obs.get('valueCodeableConcept', {}).get('coding') or []
+        if value_codings and value_codings[0].get('code') in _CURRENT_SMOKER_CODES:
+            tradeoff_data["smoker"] = True
 
     # Check for complex PCI and BMS from Procedures
-    try:
-        search_params = {'patient': patient_id, '_count': '50'}
-        # Note: fhirclient's perform() doesn't accept timeout parameter
-        # Timeout is configured via the HTTPAdapter on the session
-        procedures = procedure.Procedure.where(search_params).perform(fhir_client.server)
-        if procedures.entry:
-            # Get SNOMED codes from configuration
-            snomed_codes = CDSS_CONFIG.get('tradeoff_analysis', {}).get('snomed_codes', {})
-            complex_pci_code = snomed_codes.get('complex_pci', '397682003')
-            bms_code = snomed_codes.get('bare_metal_stent', '427183000')
-            
-            for entry in procedures.entry:
-                p = entry.resource
-                # Complex PCI
-                if _resource_has_code(p.as_json(), 'http://snomed.info/sct', complex_pci_code):
-                    tradeoff_data["complex_pci"] = True
-                # Bare-metal stent (BMS)
-                if _resource_has_code(p.as_json(), 'http://snomed.info/sct', bms_code):
-                    tradeoff_data["bms_used"] = True
-    except Exception as e:
-        logging.warning(f"Error fetching procedures for tradeoff model: {e}")
+    procedures = resources.get('procedures')
+    if procedures:
+        _flag_coded_resources(procedures, _TRADEOFF_PROCEDURE_FLAGS, tradeoff_data)
         
     # Check for OAC at discharge from MedicationRequest
-    try:
-        search_params = {'patient': patient_id, 'category': 'outpatient'}
-        # Note: fhirclient's perform() doesn't accept timeout parameter
-        # Timeout is configured via the HTTPAdapter on the session
-        med_requests = medicationrequest.MedicationRequest.where(search_params).perform(fhir_client.server)
-        if med_requests.entry:
-            # Get RxNorm codes from configuration
-            rxnorm_codes = CDSS_CONFIG.get('tradeoff_analysis', {}).get('rxnorm_codes', {})
-            oac_codes = [
-                rxnorm_codes.get('warfarin', '11289'),
-                rxnorm_codes.get('rivaroxaban', '21821'),
-                rxnorm_codes.get('apixaban', '1364430'),
-                rxnorm_codes.get('dabigatran', '1037042'),
-                rxnorm_codes.get('edoxaban', '1537033')
-            ]
-            
-            for entry in med_requests.entry:
-                mr = entry.resource
-                # Check for Oral Anticoagulants
-                if any(_resource_has_code(mr.as_json(), 'http://www.nlm.nih.gov/research/umls/rxnorm', code) for code in oac_codes):
-                    tradeoff_data["oac_discharge"] = True
-    except Exception as e:
-        logging.warning(f"Error fetching medication requests for OAC: {e}")
-
-    return tradeoff_data
+    med_requests = resources.get('med_requests')
+    if med_requests:
+        for mr in med_requests:
+            # Check for Oral Anticoagulants (MedicationRequest codes live in medicationCodeableConcept)
+            codings = mr.get('medicationCodeableConcept', {}).get('coding') or []
+            if any(coding.get('system') == _RXNORM_SYSTEM and coding.get('code') in _TRADEOFF_OAC_RXNORM_CODES
+                   for coding in codings):
+                tradeoff_data["oac_discharge"] = True
+                break  # One anticoagulant is enough to set the flag
+
+    complete = all(resources.get(key) is not None for key, _, _ in _TRADEOFF_SEARCHES)
+    return tradeoff_data, complete
+
+# The ARC-HBR model file is static, so it is parsed once per process
+_tradeoff_model = None
 
 def get_tradeoff_model_predictors():
+    """Returns the ARC-HBR tradeoff model, loading it from disk on first use."""
+    global _tradeoff_model
+    if _tradeoff_model is None:
+        _tradeoff_model = _load_tradeoff_model()
+    return _tradeoff_model
+
+def _load_tradeoff_model():
     """Loads and returns the list of all predictors from the ARC-HBR model file."""
     script_dir = os.path.dirname(__file__)
     model_path = os.path.join(script_dir, 'fhir_resources', 'valuesets', 'arc-hbr-model.json')
@@ -553,8 +775,8 @@ def get_tradeoff_model_predictors():
     logging.info(f"File exists: {os.path.exists(model_path)}")
     
     try:
-        with open(model_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(model_path, 'rb') as f:
+            data = _json_loads(f.read())
             logging.info(f"JSON loaded successfully. Keys: {list(data.keys())}")
             
             if 'tradeoffModel' not in data:
@@ -585,6 +807,18 @@ def get_tradeoff_model_predictors():
         logging.error(f"Unexpected error loading tradeoff model: {e}")
         return None
 
+# get_tradeoff_model_data() flags and the model factor each one maps to
+_TRADEOFF_DATA_FACTORS = (
+    ('diabetes', 'diabetes'),
+    ('prior_mi', 'prior_mi'),
+    ('smoker', 'smoker'),
+    ('nstemi_stemi', 'nstemi_stemi'),
+    ('complex_pci', 'complex_pci'),
+    ('bms_used', 'bms'),
+    ('copd', 'copd'),
+    ('oac_discharge', 'oac_discharge'),
+)
+
 def detect_tradeoff_factors(raw_data, demographics, tradeoff_data):
     """
     Detects which tradeoff factors are present based on patient data.
@@ -598,8 +832,10 @@ def detect_tradeoff_factors(raw_data, demographics, tradeoff_data):
     thresholds = tradeoff_config.get('risk_factor_thresholds', {})
     
     # Age threshold
+    age = demographics.get('age')
+    gender = demographics.get('gender')
     age_threshold = thresholds.get('age_threshold', 65)
-    if demographics.get('age', 0) >= age_threshold:
+    if age is not None and age >= age_threshold:
         detected_factors['age_ge_65'] = True
 
     # Hemoglobin thresholds
@@ -624,8 +860,8 @@ def detect_tradeoff_factors(raw_data, demographics, tradeoff_data):
         egfr_val = get_value_from_observation(egfr_obs[0], TARGET_UNITS['EGFR'])
     elif cr_obs:
         cr_val = get_value_from_observation(cr_obs[0], TARGET_UNITS['CREATININE'])
-        if cr_val and demographics.get('age') and demographics.get('gender'):
-            egfr_val = calculate_egfr(cr_val, demographics['age'], demographics['gender'])
+        if cr_val and age and gender:
+            egfr_val, _ = calculate_egfr(cr_val, age, gender)
             
     if egfr_val:
         egfr_ranges = thresholds.get('egfr_ranges', {})
@@ -637,22 +873,9 @@ def detect_tradeoff_factors(raw_data, demographics, tradeoff_data):
         elif egfr_val < severe['max']:
             detected_factors['egfr_lt_30'] = True
     
-    if tradeoff_data.get('diabetes'):
-        detected_factors['diabetes'] = True
-    if tradeoff_data.get('prior_mi'):
-        detected_factors['prior_mi'] = True
-    if tradeoff_data.get('smoker'):
-        detected_factors['smoker'] = True
-    if tradeoff_data.get('nstemi_stemi'):
-        detected_factors['nstemi_stemi'] = True
-    if tradeoff_data.get('complex_pci'):
-        detected_factors['complex_pci'] = True
-    if tradeoff_data.get('bms_used'):
-        detected_factors['bms'] = True
-    if tradeoff_data.get('copd'):
-        detected_factors['copd'] = True
-    if tradeoff_data.get('oac_discharge'):
-        detected_factors['oac_discharge'] = True
+    for data_key, factor in _TRADEOFF_DATA_FACTORS:
+        if tradeoff_data.get(data_key):
+            detected_factors[factor] = True
         
     return detected_factors
 
@@ -759,6 +982,15 @@ def _resource_has_code(resource, system, code):
             return True
     return False
 
+def _fast_fhir_date(date_str):
+    """
+    Parses the YYYY-MM-DD prefix of a FHIR date/dateTime by slicing, which is much
+    cheaper than strptime or dateutil. Partial dates (YYYY, YYYY-MM) return None.
+    """
+    if not date_str or len(date_str) < 10:
+        return None
+    return dt.date(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
+
 def _is_within_time_window(resource_date_str, min_months=None, max_months=None):
     """Checks if a resource date is within the specified time window from today."""
     if not resource_date_str:
@@ -800,10 +1032,12 @@ def get_patient_demographics(patient_resource):
     # Age
     if patient_resource.get("birthDate"):
         demographics["birthDate"] = patient_resource["birthDate"]
+        birth_date_str = patient_resource["birthDate"]
         try:
-            birth_date = dt.datetime.strptime(patient_resource["birthDate"], "%Y-%m-%d").date()
-            today = dt.date.today()
-            demographics["age"] = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+            birth_date = _fast_fhir_date(birth_date_str)
+            if birth_date:
+                today = dt.date.today()
+                demographics["age"] = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
         except (ValueError, TypeError):
             pass
             
@@ -822,8 +1056,8 @@ def calculate_tradeoff_scores(raw_data, demographics, tradeoff_data):
     logging.info(f"File exists: {os.path.exists(model_path)}")
     
     try:
-        with open(model_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(model_path, 'rb') as f:
+            data = _json_loads(f.read())
             if 'tradeoffModel' not in data:
                 logging.error(f"'tradeoffModel' key not found in JSON")
                 return {
@@ -872,7 +1106,7 @@ def calculate_tradeoff_scores(raw_data, demographics, tradeoff_data):
             thrombotic_factors.append(f"{factor} (HR: {ratio})")
 
     # Demographics
-    if demographics.get('age', 0) >= 65:
+    if (demographics.get('age') or 0) >= 65:
         add_score('bleeding', 'Age >= 65', 1.50)
 
     # Hemoglobin
@@ -964,35 +1198,22 @@ def get_value_from_observation(obs, unit_system):
     
     # Normalize unit: convert to lowercase and normalize notation variations
     # Handle common variations: ^ to *, µ to u, etc.
-    source_unit = source_unit_raw.lower().strip()
-    # Normalize caret (^) to asterisk (*) for exponent notation
-    source_unit = source_unit.replace('^', '*')
-    # Normalize micro symbol (µ) to 'u'
-    source_unit = source_unit.replace('µ', 'u').replace('μ', 'u')
-    # Remove spaces
-    source_unit = source_unit.replace(' ', '')
-    
-    # 1. Direct match
-    if source_unit == target_unit.lower():
-        return value
-
-    # 2. Check for common alternative writings of the target unit
-    # (e.g., "g/dL" vs "g/dl"). This is a simple case-insensitive check.
+    source_unit = _normalize_unit(source_unit_raw)
+    
+    # 1. Direct match (case-insensitive, e.g. "g/dL" vs "g/dl")
     if source_unit == target_unit.lower():
         return value
 
-    # 3. Attempt conversion
+    # 2. Attempt conversion
     conversion_factors = unit_system.get('factors', {})
-    # Also normalize keys in conversion_factors for comparison
-    normalized_factors = {}
-    for key, factor in conversion_factors.items():
-        normalized_key = key.lower().replace('^', '*').replace('µ', 'u').replace('μ', 'u').replace(' ', '')
-        normalized_factors[normalized_key] = factor
-    
-    if source_unit in normalized_factors:
-        conversion_factor = normalized_factors[source_unit]
+    normalized_factors = unit_system.get('normalized_factors')
+    if normalized_factors is None:
+        normalized_factors = {_normalize_unit(key): factor for key, factor in conversion_factors.items()}
+    
+    conversion_factor = normalized_factors.get(source_unit)
+    if conversion_factor is not None:
         converted_value = value * conversion_factor
-        logging.info(f"Converted {value} {source_unit_raw} ({source_unit}) to {converted_value:.2f} {target_unit}")
+        logging.info("Converted %s %s (%s) to %.2f %s", value, source_unit_raw, source_unit, converted_value, target_unit)
         return converted_value
     
     # Also check original source_unit_raw (case-insensitive) in original factors
@@ -1000,28 +1221,32 @@ def get_value_from_observation(obs, unit_system):
     if source_unit_original_lower in conversion_factors:
         conversion_factor = conversion_factors[source_unit_original_lower]
         converted_value = value * conversion_factor
-        logging.info(f"Converted {value} {source_unit_raw} to {converted_value:.2f} {target_unit}")
+        logging.info("Converted %s %s to %.2f %s", value, source_unit_raw, converted_value, target_unit)
         return converted_value
 
-    # 4. If no conversion is possible, log a warning and return None to prevent miscalculation
+    # 3. If no conversion is possible, log a warning and return None to prevent miscalculation
     logging.warning(f"Unit mismatch and no conversion rule found for Observation. "
                    f"Received: '{source_unit_raw}' (normalized: '{source_unit}'), Expected: '{target_unit}'. Cannot proceed with this value.")
     return None
 
+# CKD-EPI 2021 sex-specific constants: (kappa, alpha, sex multiplier)
+_CKD_EPI_2021_CONSTANTS = {
+    'female': (0.7, -0.241, 1.012),
+    'male': (0.9, -0.302, 1.0),
+}
+
 def calculate_egfr(cr_val, age, gender):
     """
     Calculates eGFR using the CKD-EPI 2021 equation.
     """
-    if not all([cr_val, age, gender]) or gender not in ['male', 'female']:
+    constants = _CKD_EPI_2021_CONSTANTS.get(gender)
+    if not cr_val or not age or constants is None:
         return None, "Missing data for eGFR calculation"
     
-    k = 0.7 if gender == 'female' else 0.9
-    alpha = -0.241 if gender == 'female' else -0.302
+    k, alpha, sex_factor = constants
     
     # CKD-EPI 2021 formula
-    egfr = 142 * (min(cr_val / k, 1) ** alpha) * (max(cr_val / k, 1) ** -1.2) * (0.9938 ** age)
-    if gender == 'female':
-        egfr *= 1.012
+    egfr = 142 * (min(cr_val / k, 1) ** alpha) * (max(cr_val / k, 1) ** -1.2) * (0.9938 ** age) * sex_factor
         
     return round(egfr), "CKD-EPI 2021"
 
@@ -1041,25 +1266,25 @@ def get_score_from_table(value, score_table, range_key):
         # For age, if older than max range, use the highest score
         max_range_item = max(score_table, key=lambda x: x[range_key][1] if range_key in x else 0)
         if value > max_range_item[range_key][1]:
-            logging.info(f"Age {value} exceeds max range {max_range_item[range_key]}, using highest score: {max_range_item.get('base_score', 0)}")
+            logging.info("Age %s exceeds max range %s, using highest score: %s", value, max_range_item[range_key], max_range_item.get('base_score', 0))
             return max_range_item.get('base_score', 0)
     elif range_key == 'hb_range':
         # For hemoglobin, if lower than min range, use the highest score (lowest Hb = highest risk)
         min_range_item = min(score_table, key=lambda x: x[range_key][0] if range_key in x else float('inf'))
         if value < min_range_item[range_key][0]:
-            logging.info(f"Hemoglobin {value} below min range {min_range_item[range_key]}, using highest score: {min_range_item.get('base_score', 0)}")
+            logging.info("Hemoglobin %s below min range %s, using highest score: %s", value, min_range_item[range_key], min_range_item.get('base_score', 0))
             return min_range_item.get('base_score', 0)
     elif range_key == 'ccr_range':
         # For creatinine clearance, if lower than min range, use the highest score (lowest CCr = highest risk)
         min_range_item = min(score_table, key=lambda x: x[range_key][0] if range_key in x else float('inf'))
         if value < min_range_item[range_key][0]:
-            logging.info(f"Creatinine clearance {value} below min range {min_range_item[range_key]}, using highest score: {min_range_item.get('base_score', 0)}")
+            logging.info("Creatinine clearance %s below min range %s, using highest score: %s", value, min_range_item[range_key], min_range_item.get('base_score', 0))
             return min_range_item.get('base_score', 0)
     elif range_key == 'wbc_range':
         # For WBC, if higher than max range, use the highest score (higher WBC = higher risk)
         max_range_item = max(score_table, key=lambda x: x[range_key][1] if range_key in x else 0)
         if value > max_range_item[range_key][1]:
-            logging.info(f"WBC {value} exceeds max range {max_range_item[range_key]}, using highest score: {max_range_item.get('base_score', 0)}")
+            logging.info("WBC %s exceeds max range %s, using highest score: %s", value, max_range_item[range_key], max_range_item.get('base_score', 0))
             return max_range_item.get('base_score', 0)
     
     return 0
@@ -1069,42 +1294,28 @@ def check_bleeding_history(conditions):
     if not CDSS_CONFIG:
         return False, []
     
-    # Get SNOMED codes from unified configuration
-    snomed_config = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
-    prior_bleeding_codes = snomed_config.get('prior_bleeding', {}).get('specific_codes', [])
-    bleeding_keywords = CDSS_CONFIG.get('bleeding_history_keywords', [])
-    
     bleeding_evidence = []
     
-    # Check SNOMED codes
     for condition in conditions:
-        # Check coded conditions
-        for coding in condition.get('code', {}).get('coding', []):
-            system = coding.get('system', '')
-            code = coding.get('code', '')
-            
-            # Check against bleeding history SNOMED codes
-            if system == 'http://snomed.info/sct' and code in prior_bleeding_codes:
-                display = coding.get('display', condition.get('code', {}).get('text', 'Bleeding history'))
-                bleeding_evidence.append(display)
-                break
-        
-        # Check text-based conditions
-        condition_text = ""
-        if condition.get('code', {}).get('text'):
-            condition_text += condition['code']['text'].lower().strip() + " "
-        for coding in condition.get('code', {}).get('coding', []):
+        code_data = condition.get('code', {})
+        # Collect the text parts in the same pass as the SNOMED code check
+        # instead of walking the codings a second time
+        text_parts = [code_data['text']] if code_data.get('text') else []
+        code_matched = False
+        for coding in code_data.get('coding', []):
             if coding.get('display'):
-                condition_text += coding['display'].lower().strip() + " "
+                text_parts.append(coding['display'])
+            
+            # Check against bleeding history SNOMED codes (one piece of evidence per condition)
+            if (not code_matched and coding.get('system') == 'http://snomed.info/sct'
+                    and coding.get('code') in _PRIOR_BLEEDING_CODES):
+                bleeding_evidence.append(coding.get('display', code_data.get('text', 'Bleeding history')))
+                code_matched = True
         
-        condition_text = condition_text.strip()
-        if condition_text:
-            for keyword in bleeding_keywords:
-                if keyword.lower() in condition_text:
-                    display_text = condition.get('code', {}).get('text', 
-                                                condition.get('code', {}).get('coding', [{}])[0].get('display', 'Bleeding history'))
-                    bleeding_evidence.append(display_text)
-                    break
+        condition_text = " ".join(part.strip() for part in text_parts).lower().strip()
+        if condition_text and _BLEEDING_HISTORY_PATTERN and _BLEEDING_HISTORY_PATTERN.search(condition_text):
+            display_text = code_data.get('text') or (code_data.get('coding') or [{}])[0].get('display', 'Bleeding history')
+            bleeding_evidence.append(display_text)
     
     has_bleeding_history = len(bleeding_evidence) > 0
     return has_bleeding_history, bleeding_evidence
@@ -1158,6 +1369,7 @@ def calculate_precise_hbr_score(raw_data, demographics):
     
     # 1. Age Score - If effective age > 30: score = (effective age - 30) × 0.25
     age = demographics.get('age')
+    gender = demographics.get('gender')
     if age:
         # Apply truncation to get effective age
         effective_age = max(MIN_AGE, min(MAX_AGE, age))
@@ -1167,10 +1379,10 @@ def calculate_precise_hbr_score(raw_data, demographics):
             age_score_raw = (effective_age - 30) * 0.25
             age_score = round(age_score_raw)
             total_score += age_score_raw  # Use raw score for total calculation
-            logging.info(f"Age score: ({effective_age} - 30) × 0.25 = {age_score_raw:.2f} → {age_score}")
+            logging.info("Age score: (%s - 30) × 0.25 = %.2f → %s", effective_age, age_score_raw, age_score)
         else:
             age_score = 0
-            logging.info(f"Age score: effective age {effective_age} ≤ 30, score = 0")
+            logging.info("Age score: effective age %s ≤ 30, score = 0", effective_age)
         
         components.append({
             "parameter": "PRECISE-HBR - Age",
@@ -1209,10 +1421,10 @@ def calculate_precise_hbr_score(raw_data, demographics):
                 hb_score_raw = (15 - effective_hb) * 2.5
                 hb_score = round(hb_score_raw)
                 total_score += hb_score_raw  # Use raw score for total calculation
-                logging.info(f"Hemoglobin score: (15 - {effective_hb}) × 2.5 = {hb_score_raw:.2f} → {hb_score}")
+                logging.info("Hemoglobin score: (15 - %s) × 2.5 = %.2f → %s", effective_hb, hb_score_raw, hb_score)
             else:
                 hb_score = 0
-                logging.info(f"Hemoglobin score: effective Hb {effective_hb} ≥ 15, score = 0")
+                logging.info("Hemoglobin score: effective Hb %s ≥ 15, score = 0", effective_hb)
             
             components.append({
                 "parameter": "PRECISE-HBR - Hemoglobin",
@@ -1245,9 +1457,11 @@ def calculate_precise_hbr_score(raw_data, demographics):
     egfr_list = raw_data.get('EGFR', [])
     creatinine_list = raw_data.get('CREATININE', [])
     
-    logging.info(f"DEBUG: eGFR list length: {len(egfr_list)}, Creatinine list length: {len(creatinine_list)}")
-    if egfr_list:
-        logging.info(f"DEBUG: eGFR observation data: {json.dumps(egfr_list[0], indent=2, default=str)}")
+    logging.info("DEBUG: eGFR list length: %s, Creatinine list length: %s", len(egfr_list), len(creatinine_list))
+    # The arguments are evaluated even when INFO is filtered, so only serialize
+    # the observation when it will actually be logged
+    if egfr_list and logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info("DEBUG: eGFR observation data: %s", json.dumps(egfr_list[0], indent=2, default=str))
     
     egfr_val = None
     egfr_source = ""
@@ -1257,15 +1471,15 @@ def calculate_precise_hbr_score(raw_data, demographics):
         egfr_obs = egfr_list[0]
         # Use the new unit-aware function
         egfr_val = get_value_from_observation(egfr_obs, TARGET_UNITS['EGFR'])
-        logging.info(f"DEBUG: Extracted eGFR value: {egfr_val}")
+        logging.info("DEBUG: Extracted eGFR value: %s", egfr_val)
         egfr_source = "Direct eGFR"
         egfr_date = egfr_obs.get('effectiveDateTime', 'N/A')
-    elif creatinine_list and age and demographics.get('gender'):
+    elif creatinine_list and age and gender:
         creatinine_obs = creatinine_list[0]
         # Use the new unit-aware function to get Creatinine in mg/dL
         creatinine_val = get_value_from_observation(creatinine_obs, TARGET_UNITS['CREATININE'])
         if creatinine_val:
-            calculated_egfr, reason = calculate_egfr(creatinine_val, age, demographics.get('gender'))
+            calculated_egfr, reason = calculate_egfr(creatinine_val, age, gender)
             if calculated_egfr:
                 egfr_val = calculated_egfr
                 egfr_source = reason
@@ -1280,10 +1494,10 @@ def calculate_precise_hbr_score(raw_data, demographics):
             egfr_score_raw = (100 - effective_egfr) * 0.05
             egfr_score = round(egfr_score_raw)
             total_score += egfr_score_raw  # Use raw score for total calculation
-            logging.info(f"eGFR score: (100 - {effective_egfr}) × 0.05 = {egfr_score_raw:.2f} → {egfr_score}")
+            logging.info("eGFR score: (100 - %s) × 0.05 = %.2f → %s", effective_egfr, egfr_score_raw, egfr_score)
         else:
             egfr_score = 0
-            logging.info(f"eGFR score: effective eGFR {effective_egfr} ≥ 100, score = 0")
+            logging.info("eGFR score: effective eGFR %s ≥ 100, score = 0", effective_egfr)
         
         components.append({
             "parameter": "PRECISE-HBR - eGFR",
@@ -1322,10 +1536,10 @@ def calculate_precise_hbr_score(raw_data, demographics):
                 wbc_score_raw = (effective_wbc - 3.0) * 0.8  # CORRECTED: × 0.8, not × 3.0
                 wbc_score = round(wbc_score_raw)
                 total_score += wbc_score_raw  # Use raw score for total calculation
-                logging.info(f"WBC score: ({effective_wbc} - 3.0) × 0.8 = {wbc_score_raw:.2f} → {wbc_score}")
+                logging.info("WBC score: (%s - 3.0) × 0.8 = %.2f → %s", effective_wbc, wbc_score_raw, wbc_score)
             else:
                 wbc_score = 0
-                logging.info(f"WBC score: effective WBC {effective_wbc} ≤ 3.0, score = 0")
+                logging.info("WBC score: effective WBC %s ≤ 3.0, score = 0", effective_wbc)
             
             components.append({
                 "parameter": "PRECISE-HBR - White Blood Cell Count",
@@ -1361,7 +1575,7 @@ def calculate_precise_hbr_score(raw_data, demographics):
     bleeding_score = 7 if has_bleeding else 0
     total_score += bleeding_score
     
-    logging.info(f"Previous bleeding score: {'Yes' if has_bleeding else 'No'} = {bleeding_score} points")
+    logging.info("Previous bleeding score: %s = %s points", 'Yes' if has_bleeding else 'No', bleeding_score)
     
     components.append({
         "parameter": "PRECISE-HBR - Prior Bleeding",
@@ -1379,7 +1593,7 @@ def calculate_precise_hbr_score(raw_data, demographics):
     anticoag_score = 5 if has_anticoagulation else 0
     total_score += anticoag_score
     
-    logging.info(f"Oral anticoagulation score: {'Yes' if has_anticoagulation else 'No'} = {anticoag_score} points")
+    logging.info("Oral anticoagulation score: %s = %s points", 'Yes' if has_anticoagulation else 'No', anticoag_score)
     
     components.append({
         "parameter": "PRECISE-HBR - Oral Anticoagulation",
@@ -1398,7 +1612,7 @@ def calculate_precise_hbr_score(raw_data, demographics):
     arc_hbr_score = 3 if has_arc_factors else 0
     total_score += arc_hbr_score
     
-    logging.info(f"ARC-HBR conditions score: {'Yes' if has_arc_factors else 'No'} = {arc_hbr_score} points")
+    logging.info("ARC-HBR conditions score: %s = %s points", 'Yes' if has_arc_factors else 'No', arc_hbr_score)
     
     # Add individual ARC-HBR elements as separate components
     components.append({
@@ -1481,17 +1695,17 @@ def calculate_precise_hbr_score(raw_data, demographics):
     # Round final score to nearest integer
     final_score = round(total_score)
     
-    logging.info(f"PRECISE-HBR V5.0 calculation complete:")
-    logging.info(f"Base score: {base_score}")
-    logging.info(f"Age score: {age_score:.2f}")
-    logging.info(f"Hemoglobin score: {hb_score:.2f}")
-    logging.info(f"eGFR score: {egfr_score:.2f}")
-    logging.info(f"WBC score: {wbc_score:.2f}")
-    logging.info(f"Bleeding score: {bleeding_score}")
-    logging.info(f"Anticoagulation score: {anticoag_score}")
-    logging.info(f"ARC-HBR score: {arc_hbr_score}")
-    logging.info(f"Total before rounding: {total_score:.2f}")
-    logging.info(f"Final score (rounded): {final_score}")
+    logging.info("PRECISE-HBR V5.0 calculation complete:")
+    logging.info("Base score: %s", base_score)
+    logging.info("Age score: %.2f", age_score)
+    logging.info("Hemoglobin score: %.2f", hb_score)
+    logging.info("eGFR score: %.2f", egfr_score)
+    logging.info("WBC score: %.2f", wbc_score)
+    logging.info("Bleeding score: %s", bleeding_score)
+    logging.info("Anticoagulation score: %s", anticoag_score)
+    logging.info("ARC-HBR score: %s", arc_hbr_score)
+    logging.info("Total before rounding: %.2f", total_score)
+    logging.info("Final score (rounded): %s", final_score)
     
     return components, final_score
 
@@ -1540,21 +1754,21 @@ def get_risk_category_info(precise_hbr_score):
             "category": "Not high bleeding risk",
             "color": "success",  # Bootstrap color class
             "bleeding_risk_percent": f"{bleeding_risk_percent:.1f}%",
-            "score_range": f"(score ≤22)"
+            "score_range": "(score ≤22)"
         }
     elif precise_hbr_score <= 26:
         return {
             "category": "HBR",
             "color": "warning",  # Bootstrap color class  
             "bleeding_risk_percent": f"{bleeding_risk_percent:.1f}%",
-            "score_range": f"(score 23-26)"
+            "score_range": "(score 23-26)"
         }
     else:  # score >= 27
         return {
             "category": "Very HBR", 
             "color": "danger",  # Bootstrap color class
             "bleeding_risk_percent": f"{bleeding_risk_percent:.1f}%",
-            "score_range": f"(score ≥27)"
+            "score_range": "(score ≥27)"
         }
 
 def get_precise_hbr_display_info(precise_hbr_score):
@@ -1563,68 +1777,109 @@ def get_precise_hbr_display_info(precise_hbr_score):
     risk category, bleeding risk percentage, and recommendations.
     """
     risk_info = get_risk_category_info(precise_hbr_score)
-    bleeding_risk_percent = calculate_bleeding_risk_percentage(precise_hbr_score)
+    bleeding_risk_text = f"{calculate_bleeding_risk_percentage(precise_hbr_score):.2f}%"
     
     return {
         "score": precise_hbr_score,
         "risk_category": risk_info["category"],
         "score_range": risk_info["score_range"],
-        "bleeding_risk_percent": f"{bleeding_risk_percent:.2f}%",
+        "bleeding_risk_percent": bleeding_risk_text,
         "color_class": risk_info["color"],
         "full_label": f"{risk_info['category']} {risk_info['score_range']}",
-        "recommendation": f"1-year risk of major bleeding: {bleeding_risk_percent:.2f}% (Bleeding Academic Research Consortium [BARC] type 3 or 5)"
+        "recommendation": f"1-year risk of major bleeding: {bleeding_risk_text} (Bleeding Academic Research Consortium [BARC] type 3 or 5)"
     }
 
+def _medication_text(med):
+    """Lower-cased text of a medication's coded concept, used for keyword matching."""
+    return str(med.get('medicationCodeableConcept', {})).lower()
+
+def _any_medication_matches(pattern, medications):
+    """True if any medication's text matches the compiled keyword pattern."""
+    if pattern is None:
+        return False
+    return any(pattern.search(med_text) for med_text in map(_medication_text, medications))
+
 def check_oral_anticoagulation(medications):
     """
     Check for long-term oral anticoagulation therapy using codes from configuration.
     Returns True if patient is on oral anticoagulants.
     """
-    # Get medication keywords from configuration
-    med_config = CDSS_CONFIG.get('medication_keywords', {})
-    oac_config = med_config.get('oral_anticoagulants', {})
-    
-    anticoagulant_codes = (
-        oac_config.get('generic_names', []) + 
-        oac_config.get('brand_names', [])
-    )
-    
-    for med in medications:
-        med_code = med.get('medicationCodeableConcept', {})
-        med_text = str(med_code).lower()
-        
-        for anticoag in anticoagulant_codes:
-            if anticoag in med_text:
-                return True
-    
-    return False
+    return _any_medication_matches(_ORAL_ANTICOAGULANT_PATTERN, medications)
 
 
 # Updated condition checking functions based on new valueset definitions
 
+def _compile_keyword_pattern(keywords):
+    """
+    Compile a keyword list into a single alternation regex; one search replaces
+    one `in` check per keyword. Whether any keyword matches is unchanged, but a
+    match reports the leftmost keyword in the text, not the first one in list
+    order. Longest keywords go first, so when several start at the same position
+    the longest one is reported (e.g. "esophageal varices" over "varices").
+    """
+    ordered = sorted({keyword.lower() for keyword in keywords if keyword}, key=len, reverse=True)
+    if not ordered:
+        return None
+    return re.compile('|'.join(re.escape(keyword) for keyword in ordered))
+
+_BLEEDING_DIATHESIS_PATTERN = _compile_keyword_pattern([
+    'bleeding disorder', 'bleeding diathesis', 'hemorrhagic diathesis',
+    'hemophilia', 'von willebrand', 'coagulation disorder'])
+_PRIOR_BLEEDING_PATTERN = _compile_keyword_pattern([
+    'hemorrhage', 'bleeding', 'hemarthrosis', 'hematuria', 'hemothorax',
+    'hemopericardium', 'hemoperitoneum', 'retroperitoneal hematoma'])
+_CANCER_PATTERN = _compile_keyword_pattern([
+    'cancer', 'malignancy', 'neoplasm', 'carcinoma', 'sarcoma', 'lymphoma', 'leukemia'])
+_CANCER_EXCLUSION_PATTERN = _compile_keyword_pattern([
+    'basal cell', 'squamous cell', 'skin cancer'])
+_BLEEDING_HISTORY_PATTERN = _compile_keyword_pattern(CDSS_CONFIG.get('bleeding_history_keywords', []))
+
+# Liver cirrhosis and portal hypertension keyword patterns from configuration
+_LIVER_CIRRHOSIS_CONFIG = CDSS_CONFIG.get('precise_hbr_snomed_codes', {}).get('liver_cirrhosis', {})
+_CIRRHOSIS_PATTERN = _compile_keyword_pattern(
+    _LIVER_CIRRHOSIS_CONFIG.get('cirrhosis_keywords', ['cirrhosis']))
+_PORTAL_HYPERTENSION_PATTERN = _compile_keyword_pattern(
+    _LIVER_CIRRHOSIS_CONFIG.get('portal_hypertension_criteria', {}).get(
+        'additional_criteria',
+        ['ascites', 'portal hypertension', 'esophageal varices', 'hepatic encephalopathy']))
+
+# Medication keyword patterns from configuration (generic and brand names)
+_MEDICATION_KEYWORDS_CONFIG = CDSS_CONFIG.get('medication_keywords', {})
+_ORAL_ANTICOAGULANT_PATTERN = _compile_keyword_pattern(
+    _MEDICATION_KEYWORDS_CONFIG.get('oral_anticoagulants', {}).get('generic_names', []) +
+    _MEDICATION_KEYWORDS_CONFIG.get('oral_anticoagulants', {}).get('brand_names', []))
+_NSAID_CORTICOSTEROID_PATTERN = _compile_keyword_pattern(
+    _MEDICATION_KEYWORDS_CONFIG.get('nsaids_corticosteroids', {}).get('nsaid_keywords', []) +
+    _MEDICATION_KEYWORDS_CONFIG.get('nsaids_corticosteroids', {}).get('corticosteroid_keywords', []))
+
+# SNOMED code sets from configuration, frozen once for constant-time membership tests
+_SNOMED_CODES_CONFIG = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
+_BLEEDING_DIATHESIS_CODES = frozenset(
+    _SNOMED_CODES_CONFIG.get('bleeding_diathesis', {}).get('specific_codes', ['64779008']))
+_PRIOR_BLEEDING_CODES = frozenset(
+    _SNOMED_CODES_CONFIG.get('prior_bleeding', {}).get('specific_codes', []))
+_PORTAL_HYPERTENSION_CODES = frozenset(
+    _SNOMED_CODES_CONFIG.get('liver_cirrhosis', {}).get('portal_hypertension_criteria', {}).get('snomed_codes', []))
+_CANCER_EXCLUDED_CODES = frozenset(
+    _SNOMED_CODES_CONFIG.get('active_cancer', {}).get('exclude_codes', ['254637007', '254632001']))
+
 def check_bleeding_diathesis_updated(conditions):
     """
     Check for chronic bleeding diathesis using codes from configuration.
+    All SNOMED codes are checked before any condition text, so the cheap set
+    lookups settle the common case without running the keyword pattern.
     """
-    # Get SNOMED codes from configuration
-    snomed_config = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
-    diathesis_config = snomed_config.get('bleeding_diathesis', {})
-    bleeding_diathesis_snomed_codes = diathesis_config.get('specific_codes', ['64779008'])
-    
     for condition in conditions:
-        # Check SNOMED codes
         for coding in condition.get('code', {}).get('coding', []):
             if (coding.get('system') == 'http://snomed.info/sct' and 
-                coding.get('code') in bleeding_diathesis_snomed_codes):
+                coding.get('code') in _BLEEDING_DIATHESIS_CODES):
                 return True, coding.get('display', 'Bleeding diathesis')
-        
-        # Check text for bleeding diathesis terms
+    
+    # Check text for bleeding diathesis terms
+    for condition in conditions:
         condition_text = get_condition_text(condition).lower()
-        bleeding_keywords = ['bleeding disorder', 'bleeding diathesis', 'hemorrhagic diathesis', 
-                           'hemophilia', 'von willebrand', 'coagulation disorder']
-        for keyword in bleeding_keywords:
-            if keyword in condition_text:
-                return True, condition_text
+        if _BLEEDING_DIATHESIS_PATTERN.search(condition_text):
+            return True, condition_text
     
     return False, None
 
@@ -1632,29 +1887,28 @@ def check_prior_bleeding_updated(conditions):
     """
     Check for prior bleeding history using codes from configuration.
     """
-    # Get SNOMED codes from configuration
-    snomed_config = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
-    prior_bleeding_config = snomed_config.get('prior_bleeding', {})
-    prior_bleeding_snomed_codes = prior_bleeding_config.get('specific_codes', [])
-    
     found_bleeding = []
-    
+
     for condition in conditions:
-        # Check SNOMED codes
+        # Keep only the best evidence for this condition and emit it once:
+        # a coded match wins over a text match, so the text is only built
+        # when no SNOMED code matched.
+        evidence = None
         for coding in condition.get('code', {}).get('coding', []):
-            if (coding.get('system') == 'http://snomed.info/sct' and 
-                coding.get('code') in prior_bleeding_snomed_codes):
-                found_bleeding.append(coding.get('display', 'Prior bleeding'))
-        
-        # Check text for bleeding terms
-        condition_text = get_condition_text(condition).lower()
-        bleeding_keywords = ['hemorrhage', 'bleeding', 'hemarthrosis', 'hematuria', 'hemothorax',
-                           'hemopericardium', 'hemoperitoneum', 'retroperitoneal hematoma']
-        for keyword in bleeding_keywords:
-            if keyword in condition_text:
-                found_bleeding.append(condition_text)
+            if (coding.get('system') == 'http://snomed.info/sct' and
+                coding.get('code') in _PRIOR_BLEEDING_CODES):
+                evidence = coding.get('display', 'Prior bleeding')
                 break
-    
+
+        if evidence is None:
+            # Check text for bleeding terms
+            condition_text = get_condition_text(condition).lower()
+            if _PRIOR_BLEEDING_PATTERN.search(condition_text):
+                evidence = condition_text
+
+        if evidence is not None:
+            found_bleeding.append(evidence)
+
     return len(found_bleeding) > 0, found_bleeding
 
 def check_liver_cirrhosis_portal_hypertension_updated(conditions):
@@ -1664,52 +1918,46 @@ def check_liver_cirrhosis_portal_hypertension_updated(conditions):
     1. Evidence of liver cirrhosis (SNOMED code or text)
     2. Evidence of portal hypertension (ascites, varices, or encephalopathy)
     """
-    # Get configuration
-    snomed_config = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
-    liver_config = snomed_config.get('liver_cirrhosis', {})
-    
-    cirrhosis_snomed_code = liver_config.get('parent_code', '19943007')
-    cirrhosis_keywords = liver_config.get('cirrhosis_keywords', ['cirrhosis'])
-    
-    pht_config = liver_config.get('portal_hypertension_criteria', {})
-    additional_criteria = pht_config.get('additional_criteria', ['ascites', 'portal hypertension', 'esophageal varices', 'hepatic encephalopathy'])
-    pht_snomed_codes = pht_config.get('snomed_codes', [])
+    cirrhosis_snomed_code = _LIVER_CIRRHOSIS_CONFIG.get('parent_code', '19943007')
     
     has_cirrhosis = False
     has_additional_criteria = False
     found_conditions = []
     
+    # First pass: SNOMED codes only
     for condition in conditions:
-        condition_text = get_condition_text(condition).lower()
-        
-        # Check for liver cirrhosis SNOMED code
         for coding in condition.get('code', {}).get('coding', []):
+            if coding.get('system') != 'http://snomed.info/sct':
+                continue
             code = coding.get('code', '')
-            system = coding.get('system', '')
-            
+
             # Check cirrhosis SNOMED code
-            if system == 'http://snomed.info/sct' and code == cirrhosis_snomed_code:
+            if code == cirrhosis_snomed_code:
                 has_cirrhosis = True
                 found_conditions.append(coding.get('display', 'Liver cirrhosis'))
             
             # Check portal hypertension SNOMED codes
-            if system == 'http://snomed.info/sct' and code in pht_snomed_codes:
+            if code in _PORTAL_HYPERTENSION_CODES:
                 has_additional_criteria = True
                 found_conditions.append(coding.get('display', 'Portal hypertension manifestation'))
-        
-        # Check text for cirrhosis keywords
-        for keyword in cirrhosis_keywords:
-            if keyword in condition_text:
+
+    # Second pass: keyword patterns, only for the criteria the codes left unmet
+    check_cirrhosis_text = not has_cirrhosis and _CIRRHOSIS_PATTERN is not None
+    check_criteria_text = not has_additional_criteria and _PORTAL_HYPERTENSION_PATTERN is not None
+    if check_cirrhosis_text or check_criteria_text:
+        for condition in conditions:
+            condition_text = get_condition_text(condition).lower()
+
+            # Check text for cirrhosis keywords
+            if check_cirrhosis_text and _CIRRHOSIS_PATTERN.search(condition_text):
                 has_cirrhosis = True
                 found_conditions.append(f"Found cirrhosis: {condition_text[:50]}...")
-                break
-        
-        # Check text for portal hypertension criteria
-        for criteria in additional_criteria:
-            if criteria in condition_text:
+            
+            # Check text for portal hypertension criteria
+            criteria_match = _PORTAL_HYPERTENSION_PATTERN.search(condition_text) if check_criteria_text else None
+            if criteria_match:
                 has_additional_criteria = True
-                found_conditions.append(f"Found portal hypertension sign: {criteria}")
-                break
+                found_conditions.append(f"Found portal hypertension sign: {criteria_match.group(0)}")
     
     # Must have BOTH cirrhosis AND additional criteria (portal hypertension signs)
     return (has_cirrhosis and has_additional_criteria), found_conditions
@@ -1722,8 +1970,8 @@ def check_active_cancer_updated(conditions):
     snomed_config = CDSS_CONFIG.get('precise_hbr_snomed_codes', {})
     cancer_config = snomed_config.get('active_cancer', {})
     malignancy_parent_code = cancer_config.get('parent_code', '363346000')
-    excluded_codes = cancer_config.get('exclude_codes', ['254637007', '254632001'])
     
+    active_conditions = []
     for condition in conditions:
         # Check clinical status first
         clinical_status = condition.get('clinicalStatus', {})
@@ -1739,6 +1987,7 @@ def check_active_cancer_updated(conditions):
         # Only consider active conditions
         if status_code != 'active':
             continue
+        active_conditions.append(condition)
         
         # Check SNOMED codes
         for coding in condition.get('code', {}).get('coding', []):
@@ -1746,27 +1995,24 @@ def check_active_cancer_updated(conditions):
                 code = coding.get('code')
                 
                 # Exclude specific skin cancers
-                if code in excluded_codes:
+                if code in _CANCER_EXCLUDED_CODES:
                     continue
                 
                 # Include malignant neoplastic disease and descendants
                 if code == malignancy_parent_code:
                     return True, coding.get('display', 'Active malignant neoplastic disease')
-        
-        # Check text for cancer terms (but still require active status)
+    
+    # Check text for cancer terms only once no active condition matched by code
+    for condition in active_conditions:
         condition_text = get_condition_text(condition).lower()
-        cancer_keywords = ['cancer', 'malignancy', 'neoplasm', 'carcinoma', 'sarcoma', 'lymphoma', 'leukemia']
-        exclusion_keywords = ['basal cell', 'squamous cell', 'skin cancer']
         
         # Check if it's an excluded skin cancer
-        is_excluded = any(exclusion in condition_text for exclusion in exclusion_keywords)
-        if is_excluded:
+        if _CANCER_EXCLUSION_PATTERN.search(condition_text):
             continue
         
         # Check for cancer keywords
-        for keyword in cancer_keywords:
-            if keyword in condition_text:
-                return True, condition_text
+        if _CANCER_PATTERN.search(condition_text):
+            return True, condition_text
     
     return False, None
 
@@ -1823,19 +2069,8 @@ def check_arc_hbr_factors(raw_data, medications):
         factors.append(f"Liver cirrhosis with portal hypertension: {liver_info}")
     
     # Check for NSAIDs or corticosteroids using keywords from configuration
-    med_config = CDSS_CONFIG.get('medication_keywords', {})
-    nsaid_config = med_config.get('nsaids_corticosteroids', {})
-    drug_codes = (
-        nsaid_config.get('nsaid_keywords', []) + 
-        nsaid_config.get('corticosteroid_keywords', [])
-    )
-    
-    for med in medications:
-        med_text = str(med.get('medicationCodeableConcept', {})).lower()
-        for code in drug_codes:
-            if code in med_text:
-                factors.append("Long-term NSAIDs or corticosteroids")
-                break
+    if _any_medication_matches(_NSAID_CORTICOSTEROID_PATTERN, medications):
+        factors.append("Long-term NSAIDs or corticosteroids")
     
     return {
         'has_factors': len(factors) > 0,
@@ -1872,22 +2107,7 @@ def check_arc_hbr_factors_detailed(raw_data, medications):
     has_liver_condition, _ = check_liver_cirrhosis_portal_hypertension_updated(conditions)
     
     # Check for NSAIDs or corticosteroids using keywords from configuration
-    has_nsaids = False
-    med_config = CDSS_CONFIG.get('medication_keywords', {})
-    nsaid_config = med_config.get('nsaids_corticosteroids', {})
-    drug_codes = (
-        nsaid_config.get('nsaid_keywords', []) + 
-        nsaid_config.get('corticosteroid_keywords', [])
-    )
-    
-    for med in medications:
-        med_text = str(med.get('medicationCodeableConcept', {})).lower()
-        for code in drug_codes:
-            if code in med_text:
-                has_nsaids = True
-                break
-        if has_nsaids:
-            break
+    has_nsaids = _any_medication_matches(_NSAID_CORTICOSTEROID_PATTERN, medications)
     
     # Determine if any factor is present
     has_any_factor = any([
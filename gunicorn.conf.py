@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration (loaded automatically from the working directory).
+
+Defaults to a single worker process with a single thread. The audit logger keeps
+its hash chain in process memory without cross-process or cross-thread locking,
+and the short-lived patient-data caches are per process (logout eviction only
+reaches the worker that handled it), so more workers or threads must wait until
+those are made process-safe. GUNICORN_WORKERS and GUNICORN_THREADS override the
+defaults; command-line flags such as -b and --timeout still take precedence.
+
+Preloading the app in the master (GUNICORN_PRELOAD=true) is opt-in: importing
+APP.py can resolve secrets through the gRPC Secret Manager client, which is not
+fork-safe, so by default each worker imports the app itself after forking.
+"""
+import os
+
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false").lower() in ("true", "1", "t")
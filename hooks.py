@@ -1,78 +1,202 @@
 import json
 import logging
 import os
+from dataclasses import dataclass
 
 from flask import Blueprint, jsonify, request
-from flask_cors import CORS
 
 from fhir_data_service import (
     get_patient_demographics,
     calculate_precise_hbr_score,
-    get_precise_hbr_display_info
+    get_precise_hbr_display_info,
+    CDSS_CONFIG
 )
 
 hooks_bp = Blueprint('hooks', __name__)
 
-# Enable CORS for ALL CDS Hooks endpoints (required for external CDS Hooks clients like sandbox.cds-hooks.org)
-CORS(hooks_bp, 
-     origins="*",  # Allow all origins for CDS Hooks
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"],
-     supports_credentials=False)
+# Risk thresholds and labels, resolved once at import rather than per request
+HIGH_RISK_THRESHOLD = CDSS_CONFIG.get('scoring_logic', {}).get('high_risk_threshold', 23)
+HIGH_RISK_LABEL = "HBR"
+VERY_HIGH_RISK_LABEL = "Very HBR"
+INDICATOR_BY_RISK_CATEGORY = {VERY_HIGH_RISK_LABEL: "critical", HIGH_RISK_LABEL: "warning"}
 
+# CORS for the /cds-services endpoints is configured once on the app in APP.py;
+# registering it on the blueprint too would run a second CORS handler per response.
 
-def check_high_bleeding_risk_medications(medications):
+
+# Prefetch entries the scoring cannot run without. A key the EHR omitted means it
+# did not prefetch the data; a key present with a null value means the query was
+# attempted and is treated as empty.
+REQUIRED_PREFETCH_KEYS = ('patient', 'medications', 'hemoglobin', 'conditions')
+
+
+def missing_prefetch_response(prefetch):
     """
-    Check if patient is on medications that increase bleeding risk.
+    Return an HTTP 412 response listing the required prefetch keys that are absent,
+    or None if all of them were supplied.
     """
-    # This function contains detailed logic for identifying specific medications
-    # based on RxNorm codes and common names.
-    aspirin_codes = {'rxnorm': ['1191'], 'names': ['aspirin']}
-    antiplatelet_agents = {
-        'clopidogrel': {'rxnorm': ['32968'], 'names': ['clopidogrel', 'plavix']},
-        'prasugrel': {'rxnorm': ['861634'], 'names': ['prasugrel', 'effient']},
-        'ticagrelor': {'rxnorm': ['1116632'], 'names': ['ticagrelor', 'brilinta']}
-    }
-    oral_anticoagulants = {
-        'warfarin': {'rxnorm': ['11289'], 'names': ['warfarin', 'coumadin']},
-        'apixaban': {'rxnorm': ['1364430'], 'names': ['apixaban', 'eliquis']},
-        'rivaroxaban': {'rxnorm': ['1114195'], 'names': ['rivaroxaban', 'xarelto']}
+    missing = [key for key in REQUIRED_PREFETCH_KEYS if key not in prefetch]
+    if not missing:
+        return None
+    logging.warning(f"CDS Hook request is missing required prefetch: {missing}")
+    return jsonify({"error": "Required prefetch data is missing.", "missing_prefetch": missing}), 412
+
+
+def parse_hook_request():
+    """
+    Parse the JSON body of a CDS Hooks request (with orjson when the app's
+    orjson JSON provider is installed).
+    Returns None if the body is missing or is not valid JSON.
+    """
+    return request.get_json(silent=True)
+
+
+def _iter_bundle_resources(bundle, resource_type):
+    """Yield the resources of the given type from a prefetch Bundle (which may be None)."""
+    for entry in (bundle or {}).get('entry') or ():
+        resource = entry.get('resource')
+        if resource and resource.get('resourceType') == resource_type:
+            yield resource
+
+
+def _iter_active_medication_requests(bundle):
+    """Yield the active MedicationRequest resources from a prefetch Bundle."""
+    for resource in _iter_bundle_resources(bundle, 'MedicationRequest'):
+        if resource.get('status', '').lower() == 'active':
+            yield resource
+
+
+def _build_raw_data(prefetch, patient_data):
+    """Map CDS Hooks prefetch bundles onto the raw_data layout used for scoring."""
+    return {
+        'patient': patient_data,
+        'HEMOGLOBIN': list(_iter_bundle_resources(prefetch.get('hemoglobin'), 'Observation')),
+        'CREATININE': list(_iter_bundle_resources(prefetch.get('creatinine'), 'Observation')),
+        'EGFR': list(_iter_bundle_resources(prefetch.get('egfr'), 'Observation')),
+        'WBC': list(_iter_bundle_resources(prefetch.get('wbc'), 'Observation')),
+        'PLATELETS': list(_iter_bundle_resources(prefetch.get('platelets'), 'Observation')),
+        'conditions': list(_iter_bundle_resources(prefetch.get('conditions'), 'Condition')),
+        'med_requests': list(_iter_active_medication_requests(prefetch.get('medications')))
     }
 
+
+# RxNorm codes and common names used to identify high bleeding risk medications.
+RXNORM_SYSTEM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+ASPIRIN_CODES = {'rxnorm': frozenset({'1191'}), 'names': ('aspirin',)}
+ANTIPLATELET_AGENTS = {
+    'clopidogrel': {'rxnorm': frozenset({'32968'}), 'names': ('clopidogrel', 'plavix')},
+    'prasugrel': {'rxnorm': frozenset({'861634'}), 'names': ('prasugrel', 'effient')},
+    'ticagrelor': {'rxnorm': frozenset({'1116632'}), 'names': ('ticagrelor', 'brilinta')}
+}
+ORAL_ANTICOAGULANTS = {
+    'warfarin': {'rxnorm': frozenset({'11289'}), 'names': ('warfarin', 'coumadin')},
+    'apixaban': {'rxnorm': frozenset({'1364430'}), 'names': ('apixaban', 'eliquis')},
+    'rivaroxaban': {'rxnorm': frozenset({'1114195'}), 'names': ('rivaroxaban', 'xarelto')}
+}
+
+
+@dataclass(slots=True, frozen=True)
+class MatchedMedication:
+    """A high bleeding risk medication found in the patient's active medications."""
+    name: str
+
+
+# One RxNorm index over every category: code -> (category, agent), so each coding of
+# a medication is classified with a single dict lookup.
+MEDICATION_CATEGORIES = (
+    ('aspirin', {'aspirin': ASPIRIN_CODES}),
+    ('antiplatelet', ANTIPLATELET_AGENTS),
+    ('anticoagulant', ORAL_ANTICOAGULANTS),
+)
+RXNORM_MEDICATION_INDEX = {
+    code: (category, agent)
+    for category, agents in MEDICATION_CATEGORIES
+    for agent, details in agents.items()
+    for code in details['rxnorm']
+}
+
+
+def _classify_medication(med_concept):
+    """
+    Return {category: agent} for the high bleeding risk categories a medication matches.
+    RxNorm codes are checked first; the medication text is only scanned for
+    categories that no code matched.
+    """
+    matched = {}
+    for coding in med_concept.get('coding', []):
+        if coding.get('system') == RXNORM_SYSTEM:
+            hit = RXNORM_MEDICATION_INDEX.get(coding.get('code'))
+            if hit:
+                matched.setdefault(*hit)
+
+    med_name = med_concept.get('text', '').lower()
+    for category, agents in MEDICATION_CATEGORIES:
+        if category in matched:
+            continue
+        for agent, details in agents.items():
+            if any(n in med_name for n in details['names']):
+                matched[category] = agent
+                break
+    return matched
+
+
+def check_high_bleeding_risk_medications(medications):
+    """
+    Check if patient is on medications that increase bleeding risk.
+    """
     found_meds = {'aspirin': False, 'antiplatelet': None, 'anticoagulant': None}
     medication_details = []
 
     for med in medications:
         if not med or 'medicationCodeableConcept' not in med:
             continue
-        med_concept = med['medicationCodeableConcept']
-        med_name = med_concept.get('text', '').lower()
-        med_codes = [c.get('code') for c in med_concept.get('coding', [])
-                     if c.get('system') == 'http://www.nlm.nih.gov/research/umls/rxnorm']
+        matched = _classify_medication(med['medicationCodeableConcept'])
 
-        # Simplified check logic for brevity
-        if any(c in aspirin_codes['rxnorm'] for c in med_codes) or any(n in med_name for n in aspirin_codes['names']):
+        if 'aspirin' in matched:
             found_meds['aspirin'] = True
-            medication_details.append({'name': 'Aspirin'})
+            medication_details.append(MatchedMedication('Aspirin'))
             continue
 
-        for agent, details in antiplatelet_agents.items():
-            if any(c in details['rxnorm'] for c in med_codes) or any(n in med_name for n in details['names']):
-                found_meds['antiplatelet'] = agent
-                medication_details.append({'name': agent.title()})
-                break
-
-        for agent, details in oral_anticoagulants.items():
-            if any(c in details['rxnorm'] for c in med_codes) or any(n in med_name for n in details['names']):
-                found_meds['anticoagulant'] = agent
-                medication_details.append({'name': agent.title()})
-                break
+        for category in ('antiplatelet', 'anticoagulant'):
+            agent = matched.get(category)
+            if agent:
+                found_meds[category] = agent
+                medication_details.append(MatchedMedication(agent.title()))
 
     has_dapt = found_meds['aspirin'] and found_meds['antiplatelet']
     has_anticoagulant = found_meds['anticoagulant']
     return has_dapt or has_anticoagulant, medication_details
 
 
+# Static parts of the cards, built once and shared by every response (never mutated)
+WARNING_CARD_SOURCE = {
+    "label": "PRECISE-HBR Bleeding Risk Calculator",
+    "url": "https://www.precisehbr.com"
+}
+WARNING_CARD_SUGGESTIONS = [
+    {
+        "label": "View Detailed Assessment",
+        "actions": [
+            {
+                "type": "create",
+                "description": "Launch detailed PRECISE-HBR risk calculator",
+                "resource": {
+                    "resourceType": "ServiceRequest",
+                    "status": "draft",
+                    "intent": "proposal",
+                    "code": {"coding": [{"system": "http://loinc.org", "code": "LA-PRECISE-HBR"}]},
+                    "subject": {"reference": "Patient/{{context.patientId}}"}
+                }
+            }
+        ]
+    },
+]
+INFO_CARD_SOURCE = {
+    "label": "PRECISE-HBR Risk Assessment",
+    "url": "https://www.acc.org/latest-in-cardiology/articles/2022/01/18/16/19/predicting-out-of-hospital-bleeding-after-pci"
+}
+
+
 def create_precise_hbr_warning_card(
         patient_name,
         precise_hbr_score,
@@ -81,58 +205,53 @@ def create_precise_hbr_warning_card(
         medications_found):
     """Create a CDS Hooks card for PRECISE-HBR high bleeding risk warning."""
 
-    medication_list = ", ".join([med['name'] for med in medications_found])
+    medication_list = ", ".join(med.name for med in medications_found)
 
     # Determine alert level based on risk category
-    if risk_category == "Very HBR":
-        indicator = "critical"
-    elif risk_category == "HBR":
-        indicator = "warning"
-    else:
-        indicator = "info"
+    indicator = INDICATOR_BY_RISK_CATEGORY.get(risk_category, "info")
 
     card = {
-        "summary": f"{risk_category}: Patient score {precise_hbr_score} ({bleeding_risk_percentage}% 1-yr risk)",
+        "summary": f"{risk_category}: Patient score {precise_hbr_score} ({bleeding_risk_percentage} 1-yr risk)",
         "detail": f"Patient on {medication_list} has a PRECISE-HBR score of {precise_hbr_score}. "
                   "Consider shorter DAPT duration and enhanced monitoring.",
         "indicator": indicator,
-        "source": {
-            "label": "PRECISE-HBR Bleeding Risk Calculator",
-            "url": "https://www.precisehbr.com"
-        },
-        "suggestions": [
-            {
-                "label": "View Detailed Assessment",
-                "actions": [
-                    {
-                        "type": "create",
-                        "description": "Launch detailed PRECISE-HBR risk calculator",
-                        "resource": {
-                            "resourceType": "ServiceRequest",
-                            "status": "draft",
-                            "intent": "proposal",
-                            "code": {"coding": [{"system": "http://loinc.org", "code": "LA-PRECISE-HBR"}]},
-                            "subject": {"reference": f"Patient/{{{{context.patientId}}}}"}
-                        }
-                    }
-                ]
-            },
-        ]
+        "source": WARNING_CARD_SOURCE,
+        "suggestions": WARNING_CARD_SUGGESTIONS
     }
     return card
 
 
-@hooks_bp.route('/cds-services', methods=['GET'])
-def cds_services_discovery():
-    """CDS Hooks service discovery endpoint."""
+def _card_patient_name(patient_data, demographics, fallback):
+    """
+    Patient name for a card, reusing the name already resolved by
+    get_patient_demographics instead of parsing the HumanName again.
+    """
+    return (demographics["name"] if patient_data.get('name') else None) or fallback
+
+
+def create_precise_hbr_info_card(patient_name, precise_hbr_score, display_info):
+    """Create the informational CDS Hooks card shown for patients below the HBR threshold."""
+    full_label = display_info['full_label']
+    return {
+        "summary": f"PRECISE-HBR Score: {precise_hbr_score} - {full_label}",
+        "indicator": "info",
+        "detail": f"{patient_name} has a {full_label.lower()} for major bleeding. "
+                  f"PRECISE-HBR score: {precise_hbr_score}. {display_info['recommendation']}",
+        "source": INFO_CARD_SOURCE,
+        "links": []
+    }
+
+
+def _load_cds_services():
+    """Load the CDS Hooks discovery document, or a minimal fallback if it is unavailable."""
     try:
-        with open('cds-services.json', 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
-        return jsonify(config_data)
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cds-services.json'),
+                  'r', encoding='utf-8') as f:
+            return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logging.error(f"Could not load cds-services.json: {e}")
         # Fallback config
-        fallback_config = {
+        return {
             "services": [
                 {
                     "hook": "medication-prescribe",
@@ -142,7 +261,16 @@ def cds_services_discovery():
                 }
             ]
         }
-        return jsonify(fallback_config)
+
+
+# The discovery document only changes with a deployment, so read it once
+CDS_SERVICES = _load_cds_services()
+
+
+@hooks_bp.route('/cds-services', methods=['GET'])
+def cds_services_discovery():
+    """CDS Hooks service discovery endpoint."""
+    return jsonify(CDS_SERVICES)
 
 
 @hooks_bp.route('/cds-services/precise_hbr_bleeding_risk_alert', methods=['POST'])
@@ -151,57 +279,44 @@ def handle_precise_hbr_bleeding_risk_hook():
     Shared handler for PRECISE-HBR high bleeding risk alerts.
     """
     try:
-        hook_request = request.get_json()
+        hook_request = parse_hook_request()
         if not hook_request:
             return jsonify({"cards": []}), 400
 
         context = hook_request.get('context', {})
-        prefetch = hook_request.get('prefetch', {})
+        prefetch = hook_request.get('prefetch') or {}
         patient_id = context.get('patientId')
         if not patient_id:
             return jsonify({"cards": []})
 
+        missing_response = missing_prefetch_response(prefetch)
+        if missing_response:
+            return missing_response
+
         patient_data = prefetch.get('patient')
-        patient_name = "Patient"
-        if patient_data:
-            name_data = patient_data.get('name', [{}])[0]
-            # Try text field first (for Taiwan FHIR format)
-            if name_data.get('text'):
-                patient_name = name_data.get('text')
-            else:
-                given = " ".join(name_data.get('given', []))
-                family = name_data.get('family', "")
-                patient_name = f"{given} {family}".strip() or patient_id
-
-        medications = prefetch.get('medications', {}).get('entry', [])
-        medication_resources = [
-            entry.get('resource') for entry in medications if entry.get('resource')]
+        if not patient_data:
+            # Without demographics the score cannot be computed, so skip the medication and lab work
+            logging.warning(f"No patient data in prefetch for patient {patient_id}")
+            return jsonify({"cards": []})
 
         has_high_risk_meds, high_risk_medications = check_high_bleeding_risk_medications(
-            medication_resources)
+            _iter_active_medication_requests(prefetch.get('medications')))
 
         if not has_high_risk_meds:
             return jsonify({"cards": []})
 
-        raw_data = {
-            'patient': patient_data,
-            'HEMOGLOBIN': [entry['resource'] for entry in prefetch.get('hemoglobin', {}).get('entry', [])],
-            'CREATININE': [entry['resource'] for entry in prefetch.get('creatinine', {}).get('entry', [])],
-            'EGFR': [entry['resource'] for entry in prefetch.get('egfr', {}).get('entry', [])],
-            'WBC': [entry['resource'] for entry in prefetch.get('wbc', {}).get('entry', [])],
-            'conditions': [entry['resource'] for entry in prefetch.get('conditions', {}).get('entry', [])]
-        }
+        raw_data = _build_raw_data(prefetch, patient_data)
 
         demographics = get_patient_demographics(patient_data)
         _, total_score = calculate_precise_hbr_score(
             raw_data, demographics)
 
-        if total_score >= 23:
-            risk_category, bleeding_risk_percentage = get_precise_hbr_display_info(
-                total_score)
+        if total_score >= HIGH_RISK_THRESHOLD:
+            display_info = get_precise_hbr_display_info(total_score)
+            patient_name = _card_patient_name(patient_data, demographics, patient_id)
             warning_card = create_precise_hbr_warning_card(
-                patient_name, total_score, risk_category,
-                bleeding_risk_percentage, high_risk_medications
+                patient_name, total_score, display_info['risk_category'],
+                display_info['bleeding_risk_percent'], high_risk_medications
             )
             return jsonify({"cards": [warning_card]})
         else:
@@ -222,76 +337,51 @@ def precise_hbr_patient_view():
     This hook is triggered automatically when a clinician opens a patient's chart.
     """
     try:
-        data = request.get_json()
+        data = parse_hook_request()
+        if not data:
+            return jsonify({"cards": []}), 400
         logging.info(f"Received patient-view CDS Hook request: {data.get('hook')}")
         
         # Extract context and prefetch data
         context = data.get('context', {})
-        prefetch = data.get('prefetch', {})
+        prefetch = data.get('prefetch') or {}
         patient_id = context.get('patientId')
         
         if not patient_id:
             logging.warning("No patientId in context for patient-view hook")
             return jsonify({"cards": []})
         
+        missing_response = missing_prefetch_response(prefetch)
+        if missing_response:
+            return missing_response
+        
         # Get patient data from prefetch
         patient_data = prefetch.get('patient')
         if not patient_data:
             logging.warning(f"No patient data in prefetch for patient {patient_id}")
             return jsonify({"cards": []})
         
-        # Get patient name for display
-        patient_name = "Patient"
-        if patient_data.get('name') and len(patient_data['name']) > 0:
-            name_parts = patient_data['name'][0]
-            # Try text field first (for Taiwan FHIR format)
-            if name_parts.get('text'):
-                patient_name = name_parts.get('text')
-            else:
-                given = ' '.join(name_parts.get('given', []))
-                family = name_parts.get('family', '')
-                patient_name = f"{given} {family}".strip() or "Patient"
-        
-        # Check medications for high bleeding risk
-        medications = prefetch.get('medications', {}).get('entry', [])
-        high_risk_medications = check_high_bleeding_risk_medications(medications)
-        
         # Prepare raw data for risk calculation
-        raw_data = {
-            'patient': patient_data,
-            'HEMOGLOBIN': [entry['resource'] for entry in prefetch.get('hemoglobin', {}).get('entry', [])],
-            'CREATININE': [entry['resource'] for entry in prefetch.get('creatinine', {}).get('entry', [])],
-            'EGFR': [entry['resource'] for entry in prefetch.get('egfr', {}).get('entry', [])],
-            'WBC': [entry['resource'] for entry in prefetch.get('wbc', {}).get('entry', [])],
-            'conditions': [entry['resource'] for entry in prefetch.get('conditions', {}).get('entry', [])]
-        }
+        raw_data = _build_raw_data(prefetch, patient_data)
         
         # Calculate risk score
         demographics = get_patient_demographics(patient_data)
+        patient_name = _card_patient_name(patient_data, demographics, "Patient")
         score_components, total_score = calculate_precise_hbr_score(raw_data, demographics)
         display_info = get_precise_hbr_display_info(total_score)
         
         # Always show an info card in patient-view (even for low risk)
-        if total_score >= 23:
-            # High risk - show warning card
-            card = create_precise_hbr_warning_card(
-                patient_name, total_score, display_info.get('full_label'),
-                display_info.get('recommendation'), high_risk_medications
-            )
-        else:
-            # Low/moderate risk - show info card
-            card = {
-                "summary": f"PRECISE-HBR Score: {total_score} - {display_info.get('full_label')}",
-                "indicator": "info",
-                "detail": f"{patient_name} has a {display_info.get('full_label').lower()} for major bleeding. "
-                         f"PRECISE-HBR score: {total_score}. {display_info.get('recommendation')}",
-                "source": {
-                    "label": "PRECISE-HBR Risk Assessment",
-                    "url": "https://www.acc.org/latest-in-cardiology/articles/2022/01/18/16/19/predicting-out-of-hospital-bleeding-after-pci"
-                },
-                "links": []
-            }
+        if total_score < HIGH_RISK_THRESHOLD:
+            # Low/moderate risk - the info card needs no medication details
+            return jsonify({"cards": [create_precise_hbr_info_card(patient_name, total_score, display_info)]})
         
+        # High risk - list the bleeding risk medications on the warning card
+        _, high_risk_medications = check_high_bleeding_risk_medications(
+            _iter_active_medication_requests(prefetch.get('medications')))
+        card = create_precise_hbr_warning_card(
+            patient_name, total_score, display_info['risk_category'],
+            display_info['bleeding_risk_percent'], high_risk_medications
+        )
         return jsonify({"cards": [card]})
     
     except Exception as e:
@@ -8,6 +8,47 @@ import re
 from typing import Pattern, List
 
 
+# Redaction patterns, compiled once at import and shared by every filter instance.
+# Each entry is a (pattern, replacement) tuple.
+_EPHI_PATTERNS: List[tuple[Pattern, str]] = [
+    # Social Security Numbers (XXX-XX-XXXX)
+    (re.compile(r'\b\d{3}-\d{2}-\d{4}\b'), '[SSN_REDACTED]'),
+    
+    # Phone numbers (various formats)
+    (re.compile(r'\b(?:\+?1[-.]?)?\(?\d{3}\)?[-.]?\d{3}[-.]?\d{4}\b'), '[PHONE_REDACTED]'),
+    
+    # Email addresses
+    (re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'), '[EMAIL_REDACTED]'),
+    
+    # Dates (MM/DD/YYYY, MM-DD-YYYY, YYYY-MM-DD)
+    (re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'), '[DATE_REDACTED]'),
+    (re.compile(r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b'), '[DATE_REDACTED]'),
+    
+    # Patient ID / MRN patterns
+    (re.compile(r'\b(?:patient[_-]?id|mrn|medical[_-]?record)[:\s]*[A-Za-z0-9-]+\b', re.IGNORECASE), '[PATIENT_ID_REDACTED]'),
+    
+    # FHIR resource IDs with Patient prefix
+    (re.compile(r'\bPatient/[A-Za-z0-9-]+\b'), 'Patient/[REDACTED]'),
+    
+    # Common name patterns (First Last format - be cautious with this)
+    # Only redact if it appears in sensitive contexts
+    (re.compile(r'\bname[:\s]+[A-Z][a-z]+\s+[A-Z][a-z]+\b', re.IGNORECASE), 'name: [NAME_REDACTED]'),
+    
+    # API Keys and Secrets (catch any that might slip through)
+    (re.compile(r'\b(?:api[_-]?key|secret|token|password)[:\s]*[A-Za-z0-9_\-+/=]{16,}\b', re.IGNORECASE), '[SECRET_REDACTED]'),
+    
+    # Access tokens
+    (re.compile(r'\b(?:Bearer\s+)[A-Za-z0-9_\-+/=.]+\b'), 'Bearer [TOKEN_REDACTED]'),
+]
+
+# Argument dictionary keys whose values are always redacted
+_SENSITIVE_KEYS = frozenset({
+    'ssn', 'social_security', 'patient_id', 'mrn', 'email', 
+    'phone', 'dob', 'date_of_birth', 'name', 'address',
+    'api_key', 'secret', 'token', 'password', 'client_secret'
+})
+
+
 class EPhiLoggingFilter(logging.Filter):
     """
     Filter to redact potential ePHI from log messages.
@@ -28,39 +69,10 @@ class EPhiLoggingFilter(logging.Filter):
     
     def _compile_patterns(self) -> List[tuple[Pattern, str]]:
         """
-        Compile regex patterns for ePHI detection.
+        Return the precompiled regex patterns for ePHI detection.
         Returns a list of (pattern, replacement) tuples.
         """
-        return [
-            # Social Security Numbers (XXX-XX-XXXX)
-            (re.compile(r'\b\d{3}-\d{2}-\d{4}\b'), '[SSN_REDACTED]'),
-            
-            # Phone numbers (various formats)
-            (re.compile(r'\b(?:\+?1[-.]?)?\(?\d{3}\)?[-.]?\d{3}[-.]?\d{4}\b'), '[PHONE_REDACTED]'),
-            
-            # Email addresses
-            (re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'), '[EMAIL_REDACTED]'),
-            
-            # Dates (MM/DD/YYYY, MM-DD-YYYY, YYYY-MM-DD)
-            (re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'), '[DATE_REDACTED]'),
-            (re.compile(r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b'), '[DATE_REDACTED]'),
-            
-            # Patient ID / MRN patterns
-            (re.compile(r'\b(?:patient[_-]?id|mrn|medical[_-]?record)[:\s]*[A-Za-z0-9-]+\b', re.IGNORECASE), '[PATIENT_ID_REDACTED]'),
-            
-            # FHIR resource IDs with Patient prefix
-            (re.compile(r'\bPatient/[A-Za-z0-9-]+\b'), 'Patient/[REDACTED]'),
-            
-            # Common name patterns (First Last format - be cautious with this)
-            # Only redact if it appears in sensitive contexts
-            (re.compile(r'\bname[:\s]+[A-Z][a-z]+\s+[A-Z][a-z]+\b', re.IGNORECASE), 'name: [NAME_REDACTED]'),
-            
-            # API Keys and Secrets (catch any that might slip through)
-            (re.compile(r'\b(?:api[_-]?key|secret|token|password)[:\s]*[A-Za-z0-9_\-+/=]{16,}\b', re.IGNORECASE), '[SECRET_REDACTED]'),
-            
-            # Access tokens
-            (re.compile(r'\b(?:Bearer\s+)[A-Za-z0-9_\-+/=.]+\b'), 'Bearer [TOKEN_REDACTED]'),
-        ]
+        return list(_EPHI_PATTERNS)
     
     def filter(self, record: logging.LogRecord) -> bool:
         """
@@ -93,17 +105,12 @@ class EPhiLoggingFilter(logging.Filter):
     def _redact_dict(self, data: dict) -> dict:
         """Redact sensitive values in dictionary."""
         redacted = {}
-        sensitive_keys = {
-            'ssn', 'social_security', 'patient_id', 'mrn', 'email', 
-            'phone', 'dob', 'date_of_birth', 'name', 'address',
-            'api_key', 'secret', 'token', 'password', 'client_secret'
-        }
         
         for key, value in data.items():
             key_lower = str(key).lower().replace('_', '').replace('-', '')
             
             # Check if key is sensitive
-            if any(sensitive in key_lower for sensitive in sensitive_keys):
+            if any(sensitive in key_lower for sensitive in _SENSITIVE_KEYS):
                 redacted[key] = '[REDACTED]'
             elif isinstance(value, dict):
                 redacted[key] = self._redact_dict(value)
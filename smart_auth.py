@@ -1,35 +1,81 @@
 import base64
 import hashlib
+import http.cookiejar
 import logging
 import secrets
-import uuid
-from urllib.parse import urlencode
+import threading
+from functools import lru_cache
+from urllib.parse import urlencode, urljoin
 
-import jwt
 import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import (Blueprint, redirect, render_template, request,
                    session, jsonify, url_for)
 
 from config import Config
 
+# orjson parses the response bytes directly and is several times faster than the json module
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 auth_bp = Blueprint('auth', __name__)
 
+# Shared HTTP session for discovery, token and other direct FHIR requests, so repeated
+# calls to the same EHR reuse pooled keep-alive connections instead of new TCP/TLS
+# handshakes. Only idempotent requests are retried (urllib3 never retries POST by default).
+# The session is shared by every user, so it must not store cookies: an EHR's
+# Set-Cookie for one user's request would otherwise be sent with the next user's.
+http_session = requests.Session()
+http_session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+_http_adapter = HTTPAdapter(
+    pool_connections=16, pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                      raise_on_status=False))
+http_session.mount('https://', _http_adapter)
+http_session.mount('http://', _http_adapter)
+
+
+# SMART endpoints of an EHR are stable, so discovery results are reused across
+# launches from the same issuer instead of being fetched on every launch.
+SMART_CONFIG_CACHE_TTL_SECONDS = 86400
+_smart_config_cache = TTLCache(maxsize=32, ttl=SMART_CONFIG_CACHE_TTL_SECONDS)
+_smart_config_cache_lock = threading.Lock()
+# One lock per issuer so concurrent cold launches against the same EHR run a
+# single discovery instead of each hitting its endpoints.
+_smart_config_fetch_locks = {}
+
+
+def response_json(response):
+    """Parses a JSON response body, with orjson when available. Raises ValueError on invalid JSON."""
+    if HAS_ORJSON:
+        return orjson.loads(response.content)
+    return response.json()
+
 
 # --- SMART 2.0 PKCE Support ---
 
+def _pkce_code_challenge(code_verifier):
+    """S256 code_challenge for a code_verifier (RFC 7636 section 4.2)."""
+    return base64.urlsafe_b64encode(
+        hashlib.sha256(
+            code_verifier.encode('utf-8')).digest()).decode('utf-8').rstrip('=')
+
+
 def generate_pkce_parameters():
     """
     Generate PKCE parameters for SMART 2.0 authentication.
     Returns code_verifier and code_challenge according to RFC 7636.
     """
-    # Generate code_verifier (43-128 characters from unreserved character set)
-    code_verifier = base64.urlsafe_b64encode(
-        secrets.token_bytes(32)).decode('utf-8').rstrip('=')
+    # Generate code_verifier (43 characters from the URL-safe unreserved character set)
+    code_verifier = secrets.token_urlsafe(32)
 
     # Generate code_challenge using SHA256 hash of code_verifier
-    code_challenge = base64.urlsafe_b64encode(
-        hashlib.sha256(
-            code_verifier.encode('utf-8')).digest()).decode('utf-8').rstrip('=')
+    code_challenge = _pkce_code_challenge(code_verifier)
 
     return code_verifier, code_challenge
 
@@ -43,51 +89,76 @@ def validate_pkce_parameters(code_verifier, code_challenge):
         return False
 
     # Recreate the challenge from the verifier
-    expected_challenge = base64.urlsafe_b64encode(
-        hashlib.sha256(
-            code_verifier.encode('utf-8')).digest()).decode('utf-8').rstrip('=')
-
-    return expected_challenge == code_challenge
+    return secrets.compare_digest(
+        _pkce_code_challenge(code_verifier).encode('utf-8'), code_challenge.encode('utf-8'))
 
 # --- Utility Functions (from original APP.py, moved here for auth context) ---
 
 
+@lru_cache(maxsize=128)
+def _smart_discovery_urls(fhir_server_url):
+    """(.well-known/smart-configuration URL, /metadata URL) for a FHIR base URL."""
+    if not fhir_server_url.endswith('/'):
+        fhir_server_url += '/'
+    return (urljoin(fhir_server_url, ".well-known/smart-configuration"),
+            urljoin(fhir_server_url, "metadata"))
+
+
 def get_smart_config(fhir_server_url):
+    """
+    Return the SMART authorization/token endpoints for a FHIR server.
+    Successful lookups are cached per server for SMART_CONFIG_CACHE_TTL_SECONDS.
+    """
+    with _smart_config_cache_lock:
+        config = _smart_config_cache.get(fhir_server_url)
+        if config is not None:
+            return config
+        fetch_lock = _smart_config_fetch_locks.setdefault(fhir_server_url, threading.Lock())
+
+    with fetch_lock:
+        # Another launch may have completed discovery while we waited
+        with _smart_config_cache_lock:
+            config = _smart_config_cache.get(fhir_server_url)
+        if config is not None:
+            return config
+
+        config = _fetch_smart_config(fhir_server_url)
+        with _smart_config_cache_lock:
+            if config is not None:
+                _smart_config_cache[fhir_server_url] = config
+            # 'iss' comes from the launch URL, so don't let the lock table grow with it
+            _smart_config_fetch_locks.pop(fhir_server_url, None)
+        return config
+
+
+def _fetch_smart_config(fhir_server_url):
+    """Discovers the SMART configuration from the server (uncached, see get_smart_config)."""
     # This function is tightly coupled with the auth flow.
     # It might be refactored into a more generic `fhir_utils.py` later.
-    from urllib.parse import urljoin
-    if not fhir_server_url.endswith('/'):
-        fhir_server_url += '/'
+    well_known_url, metadata_url = _smart_discovery_urls(fhir_server_url)
     try:
-        url = urljoin(fhir_server_url, ".well-known/smart-configuration")
-        response = requests.get(url, headers={'Accept': 'application/json'}, timeout=30)
+        response = http_session.get(well_known_url, headers={'Accept': 'application/json'}, timeout=30)
         response.raise_for_status()
-        config = response.json()
+        config = response_json(response)
         if 'authorization_endpoint' in config and 'token_endpoint' in config:
             return config
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.warning(
             f"Failed to fetch from .well-known: {e}. Falling back to /metadata.")
     try:
-        url = urljoin(fhir_server_url, "metadata")
-        response = requests.get(url, headers={'Accept': 'application/json'}, timeout=30)
+        response = http_session.get(metadata_url, headers={'Accept': 'application/json'}, timeout=30)
         response.raise_for_status()
-        capability_statement = response.json()
+        capability_statement = response_json(response)
         for rest in capability_statement.get('rest', []):
             security = rest.get('security')
             if security:
                 for extension in security.get('extension', []):
                     if extension.get('url') == "http://fhir-registry.smarthealthit.org/StructureDefinition/oauth-uris":
-                        auth_uris = {}
-                        for ext in extension.get('extension', []):
-                            if ext.get('url') == 'authorize':
-                                auth_uris['authorization_endpoint'] = ext.get(
-                                    'valueUri')
-                            elif ext.get('url') == 'token':
-                                auth_uris['token_endpoint'] = ext.get(
-                                    'valueUri')
-                        if 'authorization_endpoint' in auth_uris and 'token_endpoint' in auth_uris:
-                            return auth_uris
+                        uri_map = {ext['url']: ext.get('valueUri')
+                                   for ext in extension.get('extension', []) if 'url' in ext}
+                        if 'authorize' in uri_map and 'token' in uri_map:
+                            return {'authorization_endpoint': uri_map['authorize'],
+                                    'token_endpoint': uri_map['token']}
         return None
     except (requests.exceptions.RequestException, ValueError, KeyError) as e:
         logging.error(f"Error fetching/parsing metadata: {e}")
@@ -156,7 +227,7 @@ def launch():
             suggestions=suggestions)
 
     session['smart_config'] = smart_config
-    state = str(uuid.uuid4())
+    state = secrets.token_urlsafe(32)
     session['state'] = state
 
     code_verifier, code_challenge = generate_pkce_parameters()
@@ -202,7 +273,7 @@ def launch_cerner_sandbox():
         "authorization_endpoint": Config.CERNER_SANDBOX_CONFIG['authorization_endpoint'],
         "token_endpoint": Config.CERNER_SANDBOX_CONFIG['token_endpoint']}
     session['smart_config'] = smart_config
-    state = str(uuid.uuid4())
+    state = secrets.token_urlsafe(32)
     session['state'] = state
     code_verifier, code_challenge = generate_pkce_parameters()
     session['code_verifier'] = code_verifier
@@ -255,7 +326,9 @@ def exchange_code():
     received_state = data.get('state')
 
     session_state = session.pop('state', None)
-    if not session_state or received_state != session_state:
+    # Constant-time comparison; bytes so non-ASCII input can't raise
+    if not session_state or not secrets.compare_digest(
+            str(received_state or '').encode('utf-8'), session_state.encode('utf-8')):
         return jsonify(
             {"status": "error", "error": "State parameter mismatch."}), 400
 
@@ -279,13 +352,13 @@ def exchange_code():
     }
 
     try:
-        response = requests.post(
+        response = http_session.post(
             token_url,
             data=token_params,
             headers={'Accept': 'application/json'},
             timeout=15)
         response.raise_for_status()
-        token_response = response.json()
+        token_response = response_json(response)
 
         fhir_data = {
             'token': token_response.get('access_token'),
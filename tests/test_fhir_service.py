@@ -3,7 +3,7 @@ Tests for FHIR data service module
 """
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import ANY, Mock, patch, MagicMock
 import sys
 import os
 
@@ -110,3 +110,253 @@ def test_error_handling_invalid_patient():
         # Should handle error gracefully
         assert result is None or isinstance(result, dict)
 
+
+
+def _condition(text=None, codings=None, status='active'):
+    """Build a minimal Condition resource for the condition checkers."""
+    code = {'coding': codings or []}
+    if text:
+        code['text'] = text
+    return {
+        'resourceType': 'Condition',
+        'clinicalStatus': {'coding': [{
+            'system': 'http://terminology.hl7.org/CodeSystem/condition-clinical',
+            'code': status}]},
+        'code': code
+    }
+
+
+def test_condition_keyword_checks():
+    """Keyword-based condition checks match on condition text."""
+    has_diathesis, _ = fhir_data_service.check_bleeding_diathesis_updated(
+        [_condition('Von Willebrand disease')])
+    assert has_diathesis is True
+
+    has_cancer, _ = fhir_data_service.check_active_cancer_updated(
+        [_condition('Carcinoma of colon')])
+    assert has_cancer is True
+
+    has_skin_cancer, _ = fhir_data_service.check_active_cancer_updated(
+        [_condition('Basal cell carcinoma of skin')])
+    assert has_skin_cancer is False
+
+    has_bleeding, evidence = fhir_data_service.check_bleeding_history(
+        [_condition('Upper GI bleed due to peptic ulcer'), _condition('Essential hypertension')])
+    assert has_bleeding is True
+    assert evidence == ['Upper GI bleed due to peptic ulcer']
+
+    has_liver, found = fhir_data_service.check_liver_cirrhosis_portal_hypertension_updated(
+        [_condition('Alcoholic cirrhosis of liver'), _condition('Esophageal varices')])
+    assert has_liver is True
+    assert 'Found portal hypertension sign: esophageal varices' in found
+
+
+
+def test_liver_check_skips_text_for_criteria_met_by_code():
+    cirrhosis_code = fhir_data_service._LIVER_CIRRHOSIS_CONFIG.get('parent_code', '19943007')
+    conditions = [
+        _condition('Cirrhosis of liver', [{
+            'system': 'http://snomed.info/sct', 'code': cirrhosis_code, 'display': 'Cirrhosis of liver'}]),
+        _condition('Ascites'),
+    ]
+    has_liver, found = fhir_data_service.check_liver_cirrhosis_portal_hypertension_updated(conditions)
+    assert has_liver is True
+    assert found == ['Cirrhosis of liver', 'Found portal hypertension sign: ascites']
+
+
+def test_keyword_pattern_reports_leftmost_longest_keyword():
+    """The criterion message names the leftmost keyword, preferring the longest at a position."""
+    has_liver, found = fhir_data_service.check_liver_cirrhosis_portal_hypertension_updated(
+        [_condition('Cirrhosis'), _condition('Esophageal varices with ascites')])
+    assert has_liver is True
+    assert found[-1] == 'Found portal hypertension sign: esophageal varices'
+
+def test_prior_bleeding_single_evidence_per_condition():
+    """A coded bleeding condition with bleeding text is reported once."""
+    bleeding_code = fhir_data_service.CDSS_CONFIG['precise_hbr_snomed_codes'][
+        'prior_bleeding']['specific_codes'][0]
+    conditions = [
+        _condition('Gastrointestinal hemorrhage', [{
+            'system': 'http://snomed.info/sct',
+            'code': bleeding_code,
+            'display': 'Gastrointestinal hemorrhage'}]),
+        _condition('Essential hypertension'),
+    ]
+
+    has_bleeding, evidence = fhir_data_service.check_prior_bleeding_updated(conditions)
+
+    assert has_bleeding is True
+    assert evidence == ['Gastrointestinal hemorrhage']
+
+
+def test_calculate_egfr():
+    """CKD-EPI 2021 eGFR uses the sex-specific constants."""
+    assert fhir_data_service.calculate_egfr(1.0, 60, 'male') == (86, "CKD-EPI 2021")
+    assert fhir_data_service.calculate_egfr(1.0, 60, 'female') == (64, "CKD-EPI 2021")
+    assert fhir_data_service.calculate_egfr(1.0, 60, 'unknown')[0] is None
+    assert fhir_data_service.calculate_egfr(None, 60, 'male')[0] is None
+
+
+def test_unit_conversion_normalizes_notation():
+    """Unit variants (case, caret, micro sign, spaces) resolve to the configured factors."""
+    units = fhir_data_service.TARGET_UNITS
+    assert fhir_data_service.get_value_from_observation(
+        {'valueQuantity': {'value': 7.2, 'unit': '10^3/µL'}}, units['WBC']) == 7.2
+    assert fhir_data_service.get_value_from_observation(
+        {'valueQuantity': {'value': 120, 'unit': 'g/L'}}, units['HEMOGLOBIN']) == pytest.approx(12.0)
+    assert fhir_data_service.get_value_from_observation(
+        {'valueQuantity': {'value': 60, 'unit': 'mL/min/1.73 m^2'}}, units['EGFR']) == 60
+    assert fhir_data_service.get_value_from_observation(
+        {'valueQuantity': {'value': 1, 'unit': 'furlongs'}}, units['EGFR']) is None
+
+
+def test_get_fhir_data_caches_successful_results():
+    """Repeated requests for the same patient and token hit the FHIR server once."""
+    fhir_data_service.clear_fhir_data_cache()
+    raw_data = {'patient': {'id': 'p1'}}
+    with patch('fhir_data_service._fetch_fhir_data', return_value=(raw_data, None)) as mock_fetch:
+        first = fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+        second = fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'other-token', 'p1', 'client')
+
+    assert first == second == (raw_data, None)
+    assert mock_fetch.call_count == 2
+    # Callers get their own top-level dict, so mutations don't reach the cache
+    first[0]['extra'] = True
+    assert 'extra' not in second[0]
+    fhir_data_service.clear_fhir_data_cache()
+
+
+def test_get_fhir_data_does_not_cache_errors():
+    """Failed fetches are retried on the next request."""
+    fhir_data_service.clear_fhir_data_cache()
+    with patch('fhir_data_service._fetch_fhir_data', return_value=(None, 'error')) as mock_fetch:
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+
+    assert mock_fetch.call_count == 2
+
+
+def test_evict_fhir_data_for_token_only_drops_that_token():
+    """Logging out drops the cached data of that authorization only."""
+    fhir_data_service.clear_fhir_data_cache()
+    raw_data = {'patient': {'id': 'p1'}}
+    with patch('fhir_data_service._fetch_fhir_data', return_value=(raw_data, None)) as mock_fetch:
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'other-token', 'p1', 'client')
+        fhir_data_service.evict_fhir_data_for_token('token')
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'token', 'p1', 'client')
+        fhir_data_service.get_fhir_data('https://fhir.example.com/', 'other-token', 'p1', 'client')
+
+    assert mock_fetch.call_count == 3
+    fhir_data_service.clear_fhir_data_cache()
+
+
+def test_medication_keyword_checks():
+    warfarin = {"medicationCodeableConcept": {"text": "Coumadin 5 mg tablet"}}
+    prednisone = {"medicationCodeableConcept": {"text": "Prednisone 10 mg"}}
+    assert fhir_data_service.check_oral_anticoagulation([prednisone, warfarin])
+    assert not fhir_data_service.check_oral_anticoagulation([prednisone])
+    result = fhir_data_service.check_arc_hbr_factors({}, [prednisone])
+    assert "Long-term NSAIDs or corticosteroids" in result['factors']
+
+
+def test_detect_tradeoff_factors_handles_missing_age_and_creatinine_egfr():
+    demographics = {"age": None, "gender": None}
+    assert fhir_data_service.detect_tradeoff_factors({}, demographics, {"bms_used": True}) == {'bms': True}
+
+    raw_data = {"CREATININE": [{"valueQuantity": {"value": 3.0, "unit": "mg/dL"}}]}
+    factors = fhir_data_service.detect_tradeoff_factors(raw_data, {"age": 70, "gender": "male"}, {})
+    assert factors == {'age_ge_65': True, 'egfr_lt_30': True}
+
+
+def test_tradeoff_model_is_loaded_once():
+    with patch.object(fhir_data_service, '_tradeoff_model', None), \
+         patch.object(fhir_data_service, '_load_tradeoff_model', return_value={'bleedingEvents': {}}) as loader:
+        first = fhir_data_service.get_tradeoff_model_predictors()
+        assert fhir_data_service.get_tradeoff_model_predictors() is first
+        loader.assert_called_once()
+
+
+def test_tradeoff_condition_flags_from_snomed_codes():
+    tradeoff_data = {}
+    conditions = [
+        {"code": {"coding": [{"system": "http://snomed.info/sct", "code": "164869001"}]}},
+        {"code": {"coding": [{"system": "http://snomed.info/sct", "code": "13645005"},
+                             {"system": "http://hl7.org/fhir/sid/icd-10", "code": "73211009"}]}},
+    ]
+    fhir_data_service._flag_coded_resources(
+        conditions, fhir_data_service._TRADEOFF_CONDITION_FLAGS, tradeoff_data)
+    assert tradeoff_data == {'nstemi_stemi': True, 'copd': True}
+
+
+
+def test_tradeoff_oac_flag_from_medication_codeable_concept():
+    med_requests = [
+        {"medicationCodeableConcept": {"coding": [
+            {"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "1191"}]}},
+        {"medicationCodeableConcept": {"coding": [
+            {"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "11289"}]}},
+    ]
+    resources = {key: [] for key, _, _ in fhir_data_service._TRADEOFF_SEARCHES}
+    resources['med_requests'] = med_requests
+    fhir_data_service.clear_fhir_data_cache()
+    with patch.object(fhir_data_service, '_fetch_tradeoff_resources',
+                      return_value=resources) as mock_fetch:
+        tradeoff_data = fhir_data_service.get_tradeoff_model_data(
+            'https://fhir.example.org', 'token', 'client', 'p1')
+        cached = fhir_data_service.get_tradeoff_model_data(
+            'https://fhir.example.org', 'token', 'client', 'p1')
+    fhir_data_service.clear_fhir_data_cache()
+    assert tradeoff_data['oac_discharge'] is True
+    assert cached == tradeoff_data
+    mock_fetch.assert_called_once()
+
+
+def test_tradeoff_data_is_not_cached_after_a_failed_search():
+    """Flags left False by a failed search are refetched on the next request."""
+    resources = {key: [] for key, _, _ in fhir_data_service._TRADEOFF_SEARCHES}
+    resources['conditions'] = None
+    fhir_data_service.clear_fhir_data_cache()
+    with patch.object(fhir_data_service, '_fetch_tradeoff_resources',
+                      return_value=resources) as mock_fetch:
+        fhir_data_service.get_tradeoff_model_data('https://fhir.example.org', 'token', 'client', 'p1')
+        fhir_data_service.get_tradeoff_model_data('https://fhir.example.org', 'token', 'client', 'p1')
+    fhir_data_service.clear_fhir_data_cache()
+    assert mock_fetch.call_count == 2
+
+
+def test_tradeoff_resources_fall_back_to_individual_searches():
+    def fake_search(server, key, model, params):
+        assert params['patient'] == 'p1'
+        return None if key == 'smoking' else [{'resourceType': model.resource_type}]
+
+    with patch.object(fhir_data_service, '_perform_batch_search', return_value=None), \
+         patch.object(fhir_data_service, '_perform_tradeoff_search', side_effect=fake_search):
+        resources = fhir_data_service._fetch_tradeoff_resources(Mock(), 'p1')
+
+    assert resources['smoking'] is None
+    assert resources['conditions'] == [{'resourceType': 'Condition'}]
+    assert set(resources) == {key for key, _, _ in fhir_data_service._TRADEOFF_SEARCHES}
+
+
+def test_labs_and_conditions_use_one_batch_with_text_fallback():
+    """Batched lab results pick the newest observation; empty groups fall back to text search only."""
+    older = {'resourceType': 'Observation', 'id': 'old', 'effectiveDateTime': '2023-01-01'}
+    newer = {'resourceType': 'Observation', 'id': 'new', 'effectiveDateTime': '2024-06-01'}
+    lab_codes = {'HEMOGLOBIN': '718-7', 'WBC': '6690-2'}
+    bundles = [
+        {'entry': [{'resource': older}, {'resource': newer}]},
+        {'entry': []},
+        {'entry': [{'resource': {'resourceType': 'Condition'}}]},
+    ]
+    with patch.object(fhir_data_service, '_perform_batch_search', return_value=bundles) as batch, \
+         patch.object(fhir_data_service, '_fetch_latest_observations', return_value=[]) as single, \
+         patch.object(fhir_data_service, '_fetch_conditions') as conditions:
+        results = fhir_data_service._fetch_labs_and_conditions(Mock(), 'p1', lab_codes)
+
+    assert len(batch.call_args[0][1]) == 3
+    assert results['HEMOGLOBIN'] == [newer]
+    assert results['conditions'] == [{'resourceType': 'Condition'}]
+    single.assert_called_once_with(ANY, 'p1', 'WBC', None)
+    conditions.assert_not_called()
@@ -0,0 +1,149 @@
+"""
+Tests for the CDS Hooks service endpoints
+"""
+
+import json
+
+
+HOOK_URL = '/cds-services/precise_hbr_patient_view'
+
+
+def _post_hook(client, body, url=HOOK_URL):
+    """POST a raw body to a CDS Hooks endpoint over HTTPS (avoids Talisman's redirect)."""
+    return client.post(url, data=body, content_type='application/json',
+                       base_url='https://localhost')
+
+
+def test_hook_rejects_invalid_json(client):
+    """A body that is not valid JSON is rejected with 400."""
+    response = _post_hook(client, b'{not json')
+    assert response.status_code == 400
+    assert response.get_json() == {"cards": []}
+
+
+def test_patient_view_hook_returns_card(client):
+    """A patient-view request with prefetch data returns one info card."""
+    body = {
+        "hook": "patient-view",
+        "context": {"patientId": "123"},
+        "prefetch": {
+            "patient": {"resourceType": "Patient", "id": "123", "gender": "male",
+                        "birthDate": "1960-01-01", "name": [{"text": "Test Patient"}]},
+            "medications": {"resourceType": "Bundle", "entry": []},
+            "hemoglobin": {"resourceType": "Bundle", "entry": []},
+            "creatinine": {"resourceType": "Bundle", "entry": []},
+            "egfr": {"resourceType": "Bundle", "entry": []},
+            "wbc": {"resourceType": "Bundle", "entry": []},
+            "conditions": {"resourceType": "Bundle", "entry": []}
+        }
+    }
+    response = _post_hook(client, json.dumps(body))
+    assert response.status_code == 200
+    cards = response.get_json()["cards"]
+    assert len(cards) == 1
+    assert "PRECISE-HBR Score" in cards[0]["summary"]
+    assert cards[0]["detail"].startswith("Test Patient ")
+
+
+def test_patient_view_hook_handles_null_prefetch_bundles(client):
+    """Prefetch bundles the EHR could not fetch (null) are treated as empty."""
+    body = {
+        "hook": "patient-view",
+        "context": {"patientId": "123"},
+        "prefetch": {
+            "patient": {"resourceType": "Patient", "id": "123"},
+            "medications": {"resourceType": "Bundle", "entry": [
+                {"resource": {"resourceType": "MedicationRequest", "status": "active",
+                              "medicationCodeableConcept": {"text": "Aspirin 81 mg"}}}
+            ]},
+            "hemoglobin": None,
+            "conditions": None
+        }
+    }
+    response = _post_hook(client, json.dumps(body))
+    assert response.status_code == 200
+    assert len(response.get_json()["cards"]) == 1
+
+
+def test_bleeding_risk_alert_returns_warning_card(client):
+    """A DAPT patient with a very high PRECISE-HBR score gets a critical card."""
+    body = {
+        "hook": "medication-prescribe",
+        "context": {"patientId": "123"},
+        "prefetch": {
+            "patient": {"resourceType": "Patient", "id": "123", "gender": "male",
+                        "birthDate": "1940-01-01", "name": [{"given": ["Test"], "family": "Patient"}]},
+            "medications": {"resourceType": "Bundle", "entry": [
+                {"resource": {"resourceType": "MedicationRequest", "status": "active",
+                              "medicationCodeableConcept": {"text": "Aspirin 81 mg"}}},
+                {"resource": {"resourceType": "MedicationRequest", "status": "active",
+                              "medicationCodeableConcept": {"text": "Clopidogrel 75 mg"}}}
+            ]},
+            "hemoglobin": {"resourceType": "Bundle", "entry": [
+                {"resource": {"resourceType": "Observation",
+                              "valueQuantity": {"value": 8.0, "unit": "g/dL"}}}
+            ]},
+            "creatinine": {"resourceType": "Bundle", "entry": []},
+            "egfr": {"resourceType": "Bundle", "entry": []},
+            "wbc": {"resourceType": "Bundle", "entry": []},
+            "conditions": {"resourceType": "Bundle", "entry": []}
+        }
+    }
+    response = _post_hook(client, json.dumps(body),
+                          url='/cds-services/precise_hbr_bleeding_risk_alert')
+    assert response.status_code == 200
+    cards = response.get_json()["cards"]
+    assert len(cards) == 1
+    assert cards[0]["indicator"] == "critical"
+    assert cards[0]["summary"].startswith("Very HBR")
+
+
+def test_high_bleeding_risk_medications_match_by_rxnorm_code():
+    """A medication is recognised from its RxNorm code even without a name."""
+    from hooks import check_high_bleeding_risk_medications, MatchedMedication
+    warfarin = {"medicationCodeableConcept": {"coding": [
+        {"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "11289"}]}}
+    has_risk, details = check_high_bleeding_risk_medications([warfarin])
+    assert has_risk
+    assert details == [MatchedMedication('Warfarin')]
+
+
+def test_hook_without_required_prefetch_returns_412(client):
+    """A request missing required prefetch keys is rejected with 412 before scoring."""
+    body = {
+        "hook": "patient-view",
+        "context": {"patientId": "123"},
+        "prefetch": {"patient": {"resourceType": "Patient", "id": "123"}}
+    }
+    response = _post_hook(client, json.dumps(body))
+    assert response.status_code == 412
+    assert response.get_json()["missing_prefetch"] == ["medications", "hemoglobin", "conditions"]
+
+
+def test_prefetch_platelets_and_medications_change_the_hook_score():
+    """Platelets and active anticoagulants from prefetch now reach the PRECISE-HBR score."""
+    from hooks import CDS_SERVICES, _build_raw_data
+    from fhir_data_service import calculate_precise_hbr_score, get_patient_demographics
+    for service in CDS_SERVICES['services']:
+        assert 'code=6690-2' in service['prefetch']['wbc']
+        assert 'code=26515-7' in service['prefetch']['platelets']
+
+    patient = {"resourceType": "Patient", "gender": "male", "birthDate": "1960-01-01"}
+    prefetch = {
+        "platelets": {"resourceType": "Bundle", "entry": [{"resource": {
+            "resourceType": "Observation", "valueQuantity": {"value": 80, "unit": "10*3/uL"}}}]},
+        "medications": {"resourceType": "Bundle", "entry": [
+            {"resource": {"resourceType": "MedicationRequest", "status": "active",
+                          "medicationCodeableConcept": {"text": "Warfarin 5 mg tablet"}}},
+            {"resource": {"resourceType": "MedicationRequest", "status": "stopped",
+                          "medicationCodeableConcept": {"text": "Apixaban 5 mg tablet"}}}]}
+    }
+    demographics = get_patient_demographics(patient)
+    raw_data = _build_raw_data(prefetch, patient)
+    assert len(raw_data['med_requests']) == 1
+
+    # Previously neither bundle was mapped, which is the same as scoring without them
+    _, score_before = calculate_precise_hbr_score(_build_raw_data({}, patient), demographics)
+    _, score_after = calculate_precise_hbr_score(raw_data, demographics)
+    # +5 for oral anticoagulation, +3 for the thrombocytopenia ARC-HBR element
+    assert score_after - score_before == 8
@@ -78,3 +78,61 @@ def test_xss_prevention(client):
     if response.status_code == 200:
         assert b'<script>' not in response.data or b'&lt;script&gt;' in response.data
 
+
+
+def test_pkce_parameters_are_url_safe_and_verifiable():
+    """PKCE verifiers use only unreserved characters and validate against their challenge"""
+    import re
+    from smart_auth import generate_pkce_parameters, validate_pkce_parameters
+    code_verifier, code_challenge = generate_pkce_parameters()
+    assert re.fullmatch(r'[A-Za-z0-9_-]{43,128}', code_verifier)
+    assert validate_pkce_parameters(code_verifier, code_challenge)
+    assert not validate_pkce_parameters(code_verifier + 'x', code_challenge)
+
+
+def test_smart_config_is_cached_per_issuer():
+    """SMART discovery runs once per issuer; failed lookups are not cached"""
+    from unittest.mock import patch
+    import smart_auth
+    smart_auth._smart_config_cache.clear()
+    endpoints = {'authorization_endpoint': 'https://ehr/auth', 'token_endpoint': 'https://ehr/token'}
+    with patch.object(smart_auth, '_fetch_smart_config', side_effect=[None, endpoints]) as fetch:
+        assert smart_auth.get_smart_config('https://ehr/fhir') is None
+        assert smart_auth.get_smart_config('https://ehr/fhir') == endpoints
+        assert smart_auth.get_smart_config('https://ehr/fhir') == endpoints
+    assert fetch.call_count == 2
+    smart_auth._smart_config_cache.clear()
+
+
+def test_shared_http_session_does_not_carry_cookies_between_calls():
+    """A Set-Cookie from one user's request is not sent with the next request."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    import smart_auth
+
+    received_cookies = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received_cookies.append(self.headers.get('Cookie'))
+            self.send_response(200)
+            self.send_header('Set-Cookie', 'affinity=user-a; Path=/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/"
+        smart_auth.http_session.get(url, timeout=5)
+        smart_auth.http_session.get(url, timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert received_cookies == [None, None]
+    assert len(smart_auth.http_session.cookies) == 0
@@ -1,4 +1,5 @@
 from flask import Blueprint, render_template, request, session, jsonify, redirect, url_for
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import fhir_data_service
 from fhirclient import client
@@ -10,6 +11,11 @@ logger = logging.getLogger('werkzeug')
 # Create a Blueprint
 tradeoff_bp = Blueprint('tradeoff', __name__, template_folder='templates')
 
+# Runs the tradeoff model searches while the request thread loads the patient data.
+# Worker threads are only started on first use, so this is safe to create before
+# gunicorn forks its workers.
+_tradeoff_fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tradeoff-fetch')
+
 # --- Decorator for session validation (specific to this Blueprint) ---
 def login_required_bp(f):
     @wraps(f)
@@ -64,6 +70,15 @@ def calculate_tradeoff_api():
             return jsonify({'error': 'Patient ID or active factors are required.'}), 400
 
         fhir_session_data = session['fhir_data']
+        # The tradeoff searches don't depend on the patient data, so start them first
+        # and let both sets of FHIR round trips overlap
+        tradeoff_future = _tradeoff_fetch_executor.submit(
+            fhir_data_service.get_tradeoff_model_data,
+            fhir_server_url=fhir_session_data.get('server'),
+            access_token=fhir_session_data.get('token'),
+            client_id=fhir_session_data.get('client_id'),
+            patient_id=patient_id
+        )
         raw_data, error = fhir_data_service.get_fhir_data(
             fhir_server_url=fhir_session_data.get('server'),
             access_token=fhir_session_data.get('token'),
@@ -72,15 +87,15 @@ def calculate_tradeoff_api():
         )
         if error:
             raise Exception(f"FHIR data service failed: {error}")
-            
-        demographics = fhir_data_service.get_patient_demographics(raw_data.get('patient'))
+        if not raw_data or not raw_data.get('patient'):
+            # The tradeoff results are discarded for a patient that could not be resolved
+            tradeoff_future.cancel()
+            logger.warning(f"No patient data retrieved for tradeoff analysis of patient {patient_id}")
+            return jsonify({'error': 'Patient data could not be found in the health record system.'}), 404
+
+        demographics = fhir_data_service.get_patient_demographics(raw_data['patient'])
         
-        tradeoff_data = fhir_data_service.get_tradeoff_model_data(
-            fhir_server_url=fhir_session_data.get('server'),
-            access_token=fhir_session_data.get('token'),
-            client_id=fhir_session_data.get('client_id'),
-            patient_id=patient_id
-        )
+        tradeoff_data = tradeoff_future.result()
 
         detected_factors_list = fhir_data_service.detect_tradeoff_factors(raw_data, demographics, tradeoff_data)
         
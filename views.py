@@ -1,18 +1,19 @@
 import logging
 from datetime import datetime
 from functools import wraps
-import jwt
 import requests
 from flask import (Blueprint, redirect, render_template, request,
                    session, jsonify, url_for)
 from fhir_data_service import (
     get_fhir_data,
+    evict_fhir_data_for_token,
     calculate_risk_components,
     get_patient_demographics,
     get_precise_hbr_display_info,
     CDSS_CONFIG
 )
 from config import Config
+from smart_auth import http_session, response_json
 
 views_bp = Blueprint('views', __name__)
 
@@ -32,14 +33,12 @@ def normalize_fhir_server_url(url):
     
     url = url.rstrip('/')
     
-    # If URL doesn't end with /fhir, check if it needs to be added
-    if not url.endswith('/fhir'):
-        # Only append /fhir if it doesn't already contain it in the path
-        # This handles cases like:
-        # - http://example.com:9091/ -> needs /fhir
-        # - https://launch.smarthealthit.org/v/r4/fhir -> already has /fhir
-        if '/fhir' not in url:
-            url = f"{url}/fhir"
+    # Only append /fhir if the path doesn't already contain it (a URL ending in
+    # /fhir contains it too, so one substring check covers both cases):
+    # - http://example.com:9091/ -> needs /fhir
+    # - https://launch.smarthealthit.org/v/r4/fhir -> already has /fhir
+    if '/fhir' not in url:
+        url = f"{url}/fhir"
     
     # Ensure trailing slash for consistent API calls
     return f"{url}/"
@@ -146,6 +145,9 @@ def calculate_risk_api():
 @views_bp.route("/logout")
 def logout():
     """Clears the session and shows a logged-out message."""
+    fhir_session_data = session.get('fhir_data') or {}
+    if fhir_session_data.get('token'):
+        evict_fhir_data_for_token(fhir_session_data['token'])
     session.clear()
     return render_template("error.html", error_info={
         'title': "Logged Out",
@@ -210,7 +212,7 @@ def test_patients():
     try:
         # Fetch patients from FHIR server
         # Note: Some servers may require authentication, but SMART Health IT allows public access to some resources
-        response = requests.get(
+        response = http_session.get(
             f"{fhir_server}Patient",
             params={'_count': 20},  # Limit to 20 patients
             headers={'Accept': 'application/fhir+json'},
@@ -218,7 +220,7 @@ def test_patients():
         )
         
         if response.status_code == 200:
-            bundle = response.json()
+            bundle = response_json(response)
             
             if bundle.get('resourceType') == 'Bundle' and 'entry' in bundle:
                 for entry in bundle['entry']: